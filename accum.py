@@ -0,0 +1,159 @@
+"""
+Replaces simple accumulator loops of a checked Prog by closed-form computations.
+
+A WhileStmt qualifies if its condition compares a counter i with a loop-invariant bound n,
+and its body consists of nothing but one assignment per variable of the forms
+
+    i = i + 1 (i < n, i <= n)   or   i = i - 1 (i > n, i >= n)
+    s = s + e   s = e + s   s = s - e   (affine)
+    p = p * e   p = e * p               (geometric)
+
+where no e reads a variable assigned in the loop. With the trip count t = n - i (+ 1 for <=) resp. i - n (+ 1 for >=),
+the loop becomes
+
+    int t = ...;
+    if t > 0 { s = s + t * e; p = p * e ** t; i = i + t; }
+
+All other loops are left untouched.
+"""
+
+from tok import Tag, Tok
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, LitExpr, SymExpr
+from dead import uses
+from loops import Loops
+import opt
+import trampoline
+
+# counter step and whether the bound is included for each comparison of the form i op n
+COUNTERS = {
+    Tag.T_LT: ( 1, False),
+    Tag.T_LE: ( 1, True ),
+    Tag.T_GT: (-1, False),
+    Tag.T_GE: (-1, True ),
+}
+
+# i op n is n flip[op] i
+FLIP = {Tag.T_LT: Tag.T_GT, Tag.T_LE: Tag.T_GE, Tag.T_GT: Tag.T_LT, Tag.T_GE: Tag.T_LE}
+
+def lit(loc, val):
+    res    = LitExpr(loc, val)
+    res.ty = Tag.K_INT
+    return res
+
+def bin_expr(lhs, op, rhs):
+    res    = BinExpr(lhs.loc, lhs, op, rhs)
+    res.ty = Tag.K_INT if op.is_arith() else Tag.K_BOOL
+    return res
+
+class Summarizer:
+    def __init__(self):
+        self.summarized = [] # WhileStmts replaced
+        self.num_vars   = 0
+
+    def prog(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.stmt(prog.stmt))
+
+    def stmt(self, stmt):
+        if isinstance(stmt, StmtList):
+            stmts = []
+            for s in stmt.stmts:
+                yield self.stmt(s)
+                if isinstance(s, WhileStmt) and (res := self.summarize(s)) is not None:
+                    stmts.extend(res)
+                    self.summarized.append(s)
+                else:
+                    stmts.append(s)
+            stmt.stmts = stmts
+        elif isinstance(stmt, (WhileStmt, IfStmt)):
+            yield self.stmt(stmt.body)
+        elif isinstance(stmt, IfElseStmt):
+            yield self.stmt(stmt.body)
+            yield self.stmt(stmt.alt_body)
+
+    @staticmethod
+    def counters(cond):
+        """Yields (i, op, n) for each way to read cond as i op n with a variable i."""
+        if isinstance(cond, BinExpr) and cond.op in COUNTERS:
+            if isinstance(cond.lhs, SymExpr): yield (cond.lhs.decl, cond.op, cond.rhs)
+            if isinstance(cond.rhs, SymExpr): yield (cond.rhs.decl, FLIP[cond.op], cond.lhs)
+
+    @staticmethod
+    def accumulator(stmt):
+        """Returns (op, e) if stmt is s = s op e - or s = e op s for a commutative op."""
+        init = stmt.init
+        if not isinstance(init, BinExpr) or init.op not in (Tag.T_ADD, Tag.T_SUB, Tag.T_MUL):
+            return None
+        if isinstance(init.lhs, SymExpr) and init.lhs.decl is stmt.decl:
+            return (init.op, init.rhs)
+        if isinstance(init.rhs, SymExpr) and init.rhs.decl is stmt.decl and init.op is not Tag.T_SUB:
+            return (init.op, init.lhs)
+        return None
+
+    def match(self, loop):
+        """Returns the counter i, its step, the bound n, whether it is inclusive and the accumulators if loop qualifies."""
+        stmts = loop.body.stmts
+        if not all(isinstance(s, AssignStmt) for s in stmts):
+            return None
+        assigned = {s.decl for s in stmts}
+        if len(assigned) != len(stmts):
+            return None
+        for (i, op, n) in self.counters(loop.cond):
+            if i in assigned and not uses(n) & assigned:
+                break
+        else:
+            return None
+        (step, inclusive) = COUNTERS[op]
+
+        accs = [] # (AssignStmt, op, e)
+        for s in stmts:
+            if s.decl is i:
+                if Loops.step(s) != step:
+                    return None
+            elif (acc := self.accumulator(s)) is None or uses(acc[1]) & assigned:
+                return None
+            else:
+                accs.append((s, *acc))
+        return (i, step, n, inclusive, accs)
+
+    def summarize(self, loop):
+        """Returns the statements replacing loop or None if it does not qualify."""
+        if (match := self.match(loop)) is None:
+            return None
+        (i, step, _, _, accs) = match
+        decl = self.trip(loop.loc, match)
+
+        body = []
+        for (s, op, e) in accs:
+            if op is Tag.T_MUL:
+                delta = bin_expr(e, Tag.T_POW, Loops.sym(decl))
+            else:
+                delta = Loops.sym(decl) if opt.is_int(e, 1) else bin_expr(Loops.sym(decl), Tag.T_MUL, e)
+            s.init = bin_expr(Loops.sym(s.decl), op, delta)
+            body.append(s)
+        update      = AssignStmt(loop.loc, i.sym, bin_expr(Loops.sym(i), Tag.T_ADD if step > 0 else Tag.T_SUB, Loops.sym(decl)))
+        update.decl = i
+        body.append(update)
+
+        cond = bin_expr(Loops.sym(decl), Tag.T_GT, lit(loop.loc, 0))
+        return [decl, IfStmt(loop.loc, cond, StmtList(loop.body.loc, body))]
+
+    def trip(self, loc, match):
+        """Declares the number of iterations."""
+        (i, step, n, inclusive, _) = match
+        trip = bin_expr(n, Tag.T_SUB, Loops.sym(i)) if step > 0 else bin_expr(Loops.sym(i), Tag.T_SUB, n)
+        if inclusive:
+            trip = bin_expr(trip, Tag.T_ADD, lit(loc, 1))
+        trip = trampoline.run(opt.Folder().expr(trip))
+        self.num_vars += 1
+        return DeclStmt(loc, Tag.K_INT, Tok(loc, f"t_trip_{self.num_vars - 1}"), trip)
+
+def summarize(prog):
+    """Summarizes the accumulator loops of prog in place and returns the Summarizer listing them."""
+    summarizer = Summarizer()
+    summarizer.prog(prog)
+    prog.check() # assign slots to the new variables
+    return summarizer
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Compares the memory needed by the object AST with its packed struct-of-arrays form.
+"""
+
+import argparse
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from gen import straight
+from packed import pack
+from parse import Parser
+
+cli = argparse.ArgumentParser(description="Compares the memory of the object AST with the packed AST.")
+cli.add_argument("--size", type=int, default=20000, help="number of generated statement pairs")
+args = cli.parse_args()
+
+src      = io.StringIO(straight(args.size))
+src.name = "<bench>"
+
+tracemalloc.start()
+prog   = Parser(src).parse_prog()
+gc.collect()
+tree   = tracemalloc.get_traced_memory()[0]
+packed = pack(prog)
+del prog
+gc.collect()
+arrays = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+
+print(f"{len(packed)} nodes ({len(src.getvalue())} bytes of source)")
+print(f"object AST: {tree   / 2**20:8.1f} MiB, {tree   / len(packed):6.1f} bytes/node")
+print(f"packed AST: {arrays / 2**20:8.1f} MiB, {arrays / len(packed):6.1f} bytes/node")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Runs deeply nested programs through all phases to make sure none of them hits the recursion limit.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from gen import DEEP
+from packed import pack
+from parse import Parser
+import ir
+import vm
+import while_ast
+
+cli = argparse.ArgumentParser(description="Runs deeply nested programs through parser, checker, emitters and evaluators.")
+cli.add_argument("--depth", type=int,  default=100000, help="nesting depth")
+cli.add_argument("--shape", choices=DEEP, nargs="*", default=list(DEEP), help="program shapes to run")
+args = cli.parse_args()
+
+def phase(name, fn):
+    start = time.perf_counter()
+    out   = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        res = fn()
+    print(f"  {name:<8} {time.perf_counter() - start:7.3f}s {out.getvalue().strip()}")
+    return res
+
+def run_py(func):
+    """Compiles the Python output of the IR Func and runs it like --ir --eval-py."""
+    while_ast.EMIT = while_ast.Emit.PY
+    scope = {"__name__": "while"}
+    exec(compile(str(func), "<ir.py>", "exec"), scope) # pylint: disable=exec-used
+    return scope["main"]()
+
+print(f"recursion limit: {sys.getrecursionlimit()}")
+for shape in args.shape:
+    src      = io.StringIO(DEEP[shape](args.depth))
+    src.name = f"<{shape}>"
+    print(f"{shape} (depth {args.depth}, {len(src.getvalue())} bytes)")
+
+    prog = phase("parse", lambda: Parser(src).parse_prog())   # pylint: disable=cell-var-from-loop
+    prog = phase("pack", lambda: pack(prog).unpack())         # pylint: disable=cell-var-from-loop
+    phase("check", prog.check)
+    emitted = prog
+    if shape == "nested": # the indentation of the output alone grows quadratically with the depth
+        small      = io.StringIO(DEEP[shape](args.depth // 100))
+        small.name = f"<{shape}>"
+        emitted    = Parser(small).parse_prog()
+        emitted.check()
+        print(f"  emitting depth {args.depth // 100}")
+    for emit in (while_ast.Emit.WHILE, while_ast.Emit.C, while_ast.Emit.PY):
+        while_ast.EMIT = emit
+        phase(emit.name.lower(), lambda: len(str(emitted)))   # pylint: disable=cell-var-from-loop
+    while_ast.EMIT = while_ast.Emit.EVAL
+    phase("eval", lambda: print(prog.eval()))               # pylint: disable=cell-var-from-loop
+    phase("vm", lambda: print(vm.compile_prog(prog).run())) # pylint: disable=cell-var-from-loop
+    phase("ir", lambda: print(ir.lower(prog).run()))        # pylint: disable=cell-var-from-loop
+    phase("ir-py", lambda: print(run_py(ir.lower(emitted))))  # pylint: disable=cell-var-from-loop
@@ -0,0 +1,54 @@
+"""
+Generates synthetic While programs of parameterized size.
+"""
+
+def straight(n):
+    """n declarations and if-else statements in one block."""
+    res = ["int s = 0;\n"]
+    for i in range(n):
+        res.append(f"int v{i} = (s + {i}) * 3 - {i % 7};\n")
+        res.append(f"if v{i} >= 10 {{ s = s + 1; }} else {{ s = s - 1; }}\n")
+    res.append("return s;\n")
+    return "".join(res)
+
+def scopes(n):
+    """n blocks, each declaring the same names again and nesting a loop with a scope of its own; yields n."""
+    res = ["int s = 0;\n"]
+    for i in range(n):
+        res.append(f"if s >= {i % 5} {{ int a = s + {i}; int b = a + 1; while b > a {{ int c = b - 1; b = c; }} s = s + b - a + 1; }}\n")
+    res.append("return s;\n")
+    return "".join(res)
+
+# deeply nested shapes; each yields a value of 1 (or true) so the result is easy to verify
+
+def parens(n):
+    """An expression nested in n pairs of parentheses."""
+    return f"int x = {'(' * n}1{')' * n};\nreturn x;\n"
+
+def chain(n):
+    """A left-leaning chain of n additions."""
+    return "int x = 1" + " + 0" * n + ";\nreturn x;\n"
+
+def unary(n):
+    """n nested unary minus operators (n even)."""
+    return f"int x = {'- ' * n}1;\nreturn x;\n"
+
+def nested(n):
+    """n nested while loops, each running exactly once as x stays 0, and n nested ifs around the innermost one."""
+    res = ["int x = 0;\n"]
+    for i in range(n):
+        res.append(f"bool b{i} = true;\nwhile b{i} {{ b{i} = x < 0;\n") # x is looked up through all scopes
+    res.append("if true { " * n + "x = x + 1;" + " }" * n + "\n")
+    res.append("}\n" * n)
+    res.append("return x;\n")
+    return "".join(res)
+
+DEEP = {"parens": parens, "chain": chain, "unary": unary, "nested": nested}
+
+# shapes of the benchmark suite, each with the sizes to run it at by default
+SHAPES = {
+    "straight": (straight, (1000, 2000, 4000)),
+    "scopes":   (scopes,   (1000, 2000, 4000)),
+    "chain":    (chain,    (5000, 10000, 20000)),
+    "nested":   (nested,   (2000, 4000, 8000)),
+}
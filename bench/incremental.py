@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Measures how long incr.Document takes to take in small edits of a large program compared to parsing and checking it anew.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from gen import straight
+from incr import Document
+from parse import Parser
+
+cli = argparse.ArgumentParser(description="Compares incremental edits with parsing and checking the whole program.")
+cli.add_argument("--size",  type=int, default=50000, help="number of generated statement pairs (two lines each)")
+cli.add_argument("--edits", type=int, default=20,    help="number of edits of each kind")
+cli.add_argument("--seed",  type=int, default=0,     help="seed of the random positions")
+args = cli.parse_args()
+
+def timed(fn):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        res = fn()
+    return (time.perf_counter() - start, res)
+
+def full(text):
+    src      = io.StringIO(text)
+    src.name = "<bench>"
+    prog     = Parser(src).parse_prog()
+    prog.check()
+    return prog
+
+# each kind picks a random place of text and returns (offset, removed, inserted) of an edit and of the edit undoing it
+
+def digit(text, rand):
+    offset = text.index("3 - ", rand.randrange(len(text) - 10))
+    return ((offset, 1, "4"), (offset, 1, "3"))
+
+def space(text, rand):
+    offset = text.index("\n", rand.randrange(len(text) - 10))
+    return ((offset, 0, " "), (offset, 1, ""))
+
+def rename(text, rand):
+    offset = text.index("if v", rand.randrange(len(text) - 100)) + 4
+    return ((offset, 0, "x"), (offset, 1, ""))
+
+def declare(text, rand):
+    offset = text.index("\nif", rand.randrange(len(text) - 100)) + 1
+    return ((offset, 0, "int t = 1;\n"), (offset, 11, ""))
+
+def brace(text, rand):
+    """A stray '{' ends the statements of the program, so undoing it has to parse the rest of the text again."""
+    offset = text.index("\nif", rand.randrange(len(text) - 100)) + 1
+    return ((offset, 0, "{"), (offset, 1, ""))
+
+KINDS = {"digit": digit, "space": space, "rename": rename, "declare": declare, "brace": brace}
+
+def main():
+    rand = random.Random(args.seed)
+    text = straight(args.size)
+    print(f"{text.count(chr(10))} lines, {len(text)} bytes")
+    print(f"  {'parse + check':<14} {timed(lambda: full(text))[0] * 1000:9.1f} ms")
+    (secs, doc) = timed(lambda: Document("<bench>", text))
+    print(f"  {'document':<14} {secs * 1000:9.1f} ms")
+
+    for (name, kind) in KINDS.items():
+        (does, undoes) = ([], [])
+        for _ in range(args.edits):
+            (do, undo) = kind(doc.text, rand)
+            does.append(timed(lambda: doc.edit(*do))[0])     # pylint: disable=cell-var-from-loop
+            undoes.append(timed(lambda: doc.edit(*undo))[0]) # pylint: disable=cell-var-from-loop
+        print(f"  {name:<14} {statistics.median(does) * 1000:9.3f} ms, undo {statistics.median(undoes) * 1000:9.3f} ms (median)")
+    assert doc.text == text
+
+main()
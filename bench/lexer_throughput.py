@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Measures the throughput of the Lexer in tokens per second.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from gen import straight
+from lexer import Lexer
+from tok import Tag
+
+cli = argparse.ArgumentParser(description="Measures the throughput of the Lexer.")
+cli.add_argument("--size",    type=int, default=20000, help="number of generated statement pairs")
+cli.add_argument("--repeat",  type=int, default=3,     help="number of runs; the best one is reported")
+args = cli.parse_args()
+
+src  = io.StringIO(straight(args.size))
+best = None
+for _ in range(args.repeat):
+    src.seek(0)
+    src.name = "<bench>"
+    start = time.perf_counter()
+    lexer = Lexer(src)
+    num   = 0
+    while not lexer.lex().isa(Tag.M_EOF):
+        num += 1
+    time_ = time.perf_counter() - start
+    best  = time_ if best is None else min(best, time_)
+
+print(f"{num} tokens ({len(src.getvalue())} bytes) in {best:.3f}s: {num / best:,.0f} tokens/s")
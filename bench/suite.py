@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Times each phase of the compiler on generated programs of several shapes and sizes.
+
+Like timeit, phases run with the garbage collector turned off, whose cost grows with all objects alive and obscures that of the phase.
+The growth of each phase fitted over all sizes exposes super-linear behavior;
+--save stores the results as a JSON baseline, and --baseline fails if a phase got slower than the baseline by more than --threshold.
+"""
+
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from gen import SHAPES
+from lexer import Lexer
+from parse import Parser
+from tok import Tag
+import driver
+import err
+import ir
+import vm
+import while_ast
+
+NOISE = 0.001 # s; differences below this are never regressions
+
+cli = argparse.ArgumentParser(description="Times lexer, parser, checker, emitters, back ends and optimizer on generated programs.")
+cli.add_argument("--shape",      choices=SHAPES, nargs="*", default=list(SHAPES), help="program shapes to run")
+cli.add_argument("--scale",      type=float, default=1.0,  help="factor applied to the sizes of each shape")
+cli.add_argument("--repeat",     type=int,   default=3,    help="number of runs; the best time of each phase is reported")
+cli.add_argument("--save",       metavar="file",           help="write the results to this JSON file")
+cli.add_argument("--baseline",   metavar="file",           help="compare the results with this JSON file written by --save")
+cli.add_argument("--threshold",  type=float, default=0.25, help="fail if a phase takes more than this fraction longer than in the baseline "
+                                                                "(default: 0.25)")
+cli.add_argument("--max-growth", type=float,               help="fail if the time of a phase grows faster than the size to this power")
+
+def lex(text):
+    src      = io.StringIO(text)
+    src.name = "<bench>"
+    lexer    = Lexer(src)
+    while not lexer.lex().isa(Tag.M_EOF):
+        pass
+
+def parse(text):
+    src      = io.StringIO(text)
+    src.name = "<bench>"
+    return Parser(src).parse_prog()
+
+def emit(node, mode):
+    while_ast.EMIT = mode
+    return len(str(node))
+
+def phases(text):
+    """Runs all phases on text once with the garbage collector turned off and returns the time of each."""
+    gc.collect()
+    gc.disable()
+    try:
+        return timings(text)
+    finally:
+        gc.enable()
+
+def timings(text):
+    res   = {}
+    clock = time.perf_counter
+
+    start = clock()
+    lex(text)
+    res["lex"] = clock() - start
+
+    start = clock()
+    prog  = parse(text)
+    res["parse"] = clock() - start
+
+    start = clock()
+    prog.check()
+    res["check"] = clock() - start
+    if err.DIAGS.num_errors != 0:
+        err.DIAGS.flush()
+        sys.exit("error: generated program is invalid")
+
+    for mode in (while_ast.Emit.WHILE, while_ast.Emit.C, while_ast.Emit.PY):
+        start = clock()
+        emit(prog, mode)
+        res[mode.name.lower()] = clock() - start
+
+    start = clock()
+    func  = ir.lower(prog)
+    res["ir"] = clock() - start
+
+    for mode in (while_ast.Emit.C, while_ast.Emit.PY):
+        start = clock()
+        emit(func, mode)
+        res[f"ir.{mode.name.lower()}"] = clock() - start
+
+    start = clock()
+    vm.compile_prog(prog)
+    res["vm"] = clock() - start
+
+    while_ast.EMIT = while_ast.Emit.EVAL
+    start = clock()
+    prog.closure()
+    res["closure"] = clock() - start
+
+    start = clock()
+    driver.optimize(prog, 2, False)
+    res["opt"] = clock() - start
+    return res
+
+def growth(sizes, times):
+    """The power of the size the time grows with: the slope of a least-squares fit of log(time) over log(size)."""
+    if len(set(sizes)) < 2 or min(times) <= 0:
+        return None
+    (xs, ys) = ([math.log(size) for size in sizes], [math.log(secs) for secs in times])
+    (mx, my) = (sum(xs) / len(xs), sum(ys) / len(ys))
+    return sum((x - mx) * (y - my) for (x, y) in zip(xs, ys)) / sum((x - mx) ** 2 for x in xs)
+
+def bench(args):
+    """Returns {shape: {size: {phase: seconds}}} and prints them as a table."""
+    results = {}
+    for shape in args.shape:
+        (gen, sizes) = SHAPES[shape]
+        sizes = [max(1, round(size * args.scale)) for size in sizes]
+        print(shape)
+        results[shape] = {}
+        for size in sizes:
+            text = gen(size)
+            best = {}
+            for _ in range(args.repeat):
+                for (phase, secs) in phases(text).items():
+                    best[phase] = min(secs, best.get(phase, secs))
+            if size == sizes[0]:
+                print(f"    {'size':>8} {'bytes':>10}" + "".join(f" {phase:>8}" for phase in best))
+            print(f"    {size:>8} {len(text):>10}" + "".join(f" {secs:>7.3f}s" for secs in best.values()))
+            results[shape][str(size)] = best
+        exps = {phase: growth(sizes, [results[shape][str(size)][phase] for size in sizes]) for phase in best}
+        print(f"    {'growth':>8} {'':>10}" + "".join(f" {'-':>8}" if exp is None else f" {exp:>8.2f}" for exp in exps.values()))
+    return results
+
+def regressions(args, results):
+    """Yields a message for each phase that is slower than in the baseline or grows too fast."""
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as in_file:
+            baseline = json.load(in_file)["results"]
+        for (shape, sizes) in results.items():
+            for (size, times) in sizes.items():
+                for (phase, secs) in times.items():
+                    if (base := baseline.get(shape, {}).get(size, {}).get(phase)) is None:
+                        continue
+                    if secs > base * (1 + args.threshold) + NOISE:
+                        yield f"{shape} {size} {phase}: {secs:.3f}s instead of {base:.3f}s ({100 * (secs / base - 1):+.0f}%)"
+
+    if args.max_growth is not None:
+        for (shape, sizes) in results.items():
+            for phase in list(sizes.values())[0]:
+                exp = growth([int(size) for size in sizes], [times[phase] for times in sizes.values()])
+                if exp is not None and exp > args.max_growth:
+                    yield f"{shape} {phase}: time grows with size to the power of {exp:.2f}"
+
+def main():
+    args    = cli.parse_args()
+    results = bench(args)
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as out_file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, out_file, indent=4)
+            out_file.write("\n")
+
+    failed = list(regressions(args, results))
+    for msg in failed:
+        print(f"regression: {msg}", file=sys.stderr)
+    if failed:
+        sys.exit(f"error: {len(failed)} regression(s)")
+
+main()
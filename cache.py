@@ -0,0 +1,191 @@
+"""
+A persistent content-addressed cache in $XDG_CACHE_HOME/whilec (~/.cache/whilec by default).
+
+Each file is named by a SHA-256 key and a kind. The key of a source file covers its text, the options that affect
+the result, and the compiler itself, so editing any module of the compiler invalidates all old entries.
+Every hit refreshes the modification time of the file; once the cache grows beyond MAX_SIZE bytes,
+the least recently used files are removed.
+A long-running process like server.py sets MEMORY to keep the most recently used entries in memory as well.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import tempfile
+
+from loc import Source
+from packed import pack, Packed
+import vm
+
+# WHILEC_CACHE_SIZE overrides it
+MAX_SIZE = 64 * 1024 * 1024
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "whilec")
+
+def max_size():
+    return int(os.environ.get("WHILEC_CACHE_SIZE", MAX_SIZE))
+
+VERSION = None
+
+MEMORY      = None # (key, kind) -> text or object, least recently used first; e.g. collections.OrderedDict()
+MEMORY_SIZE = 256  # entries
+
+def compiler_version():
+    """Hash of the sources of the compiler."""
+    global VERSION
+    if VERSION is None:
+        here   = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(here)):
+            if name.endswith(".py"):
+                with open(os.path.join(here, name), "rb") as in_file:
+                    digest.update(name.encode() + b"\0" + in_file.read())
+        VERSION = digest.hexdigest()
+    return VERSION
+
+def key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def path(k, kind):
+    return os.path.join(cache_dir(), f"{k}.{kind}")
+
+def touch(filename):
+    """Marks filename as used; returns whether it exists."""
+    try:
+        os.utime(filename)
+        return True
+    except OSError:
+        return False
+
+def store(filename, write, mode = None):
+    """Creates filename atomically by calling write with a binary file object, then evicts old entries."""
+    os.makedirs(cache_dir(), exist_ok=True)
+    (fd, tmp) = tempfile.mkstemp(dir=cache_dir(), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out_file:
+            write(out_file)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    evict()
+
+def evict():
+    """Removes the least recently used files until the cache fits into max_size."""
+    stats = []
+    try:
+        for entry in os.scandir(cache_dir()):
+            if entry.is_file() and not entry.name.endswith(".tmp"): # the latter are still being written
+                stat = entry.stat()
+                stats.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError: # another process got in the way - try again next time
+        return
+    size = sum(size for (_, size, _) in stats)
+    for (_, file_size, filename) in sorted(stats):
+        if size <= max_size():
+            break
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+        size -= file_size
+
+class Entry:
+    """All cached data of one source file compiled with certain options."""
+
+    def __init__(self, name, text, *options):
+        self.name = name
+        self.text = text
+        self.key  = key(compiler_version(), text, *options)
+
+    def recall(self, kind):
+        """Returns what remember stored for kind or None."""
+        if MEMORY is None or (res := MEMORY.get((self.key, self.name, kind))) is None:
+            return None
+        MEMORY.move_to_end((self.key, self.name, kind))
+        return res
+
+    def remember(self, kind, obj):
+        # unlike files, objects like a Prog refer to the name of their source in their Locs
+        if MEMORY is not None:
+            MEMORY[(self.key, self.name, kind)] = obj
+            MEMORY.move_to_end((self.key, self.name, kind))
+            while len(MEMORY) > MEMORY_SIZE:
+                MEMORY.popitem(last=False)
+
+    def open(self, kind):
+        """Returns the cached text file of the given kind or None."""
+        filename = path(self.key, kind)
+        if not touch(filename):
+            return None
+        try:
+            return open(filename, "r", encoding="ASCII")
+        except OSError: # evicted in the meantime
+            return None
+
+    def get(self, kind):
+        """Returns the cached text of the given kind or None."""
+        if (text := self.recall(kind)) is not None:
+            return text
+        in_file = self.open(kind)
+        if in_file is None:
+            return None
+        with in_file:
+            text = in_file.read()
+        self.remember(kind, text)
+        return text
+
+    def write(self, kind, write):
+        """Caches the text of the given kind that write writes to a text file."""
+        def write_text(out_file):
+            with io.TextIOWrapper(out_file, encoding="ASCII", newline="") as text_file:
+                write(text_file)
+        store(path(self.key, kind), write_text)
+
+    def put(self, kind, text):
+        self.write(kind, lambda out_file: out_file.write(text))
+        self.remember(kind, text)
+
+    def load(self, kind, load):
+        filename = path(self.key, kind)
+        if not touch(filename):
+            return None
+        try:
+            with open(filename, "rb") as in_file:
+                return load(in_file)
+        except (OSError, ValueError, struct.error):
+            return None # broken entry - compile again
+
+    def get_prog(self):
+        """Returns the cached Prog - unchecked - or None."""
+        if (prog := self.recall("prog")) is not None:
+            return prog
+        packed = self.load("prog", lambda in_file: Packed.load(in_file, Source(self.name, self.text)))
+        if packed is None:
+            return None
+        prog = packed.unpack()
+        self.remember("prog", prog)
+        return prog
+
+    def put_prog(self, prog):
+        store(path(self.key, "prog"), pack(prog).save)
+        self.remember("prog", prog)
+
+    def get_code(self):
+        """Returns the cached vm.Code or None."""
+        if (code := self.recall("wbc")) is None and (code := self.load("wbc", vm.Code.load)) is not None:
+            self.remember("wbc", code)
+        return code
+
+    def put_code(self, code):
+        store(path(self.key, "wbc"), code.save)
+        self.remember("wbc", code)
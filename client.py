@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Thin client for server.py: takes the same arguments as while.py, lets the server run them and prints its reply.
+
+Only built-in modules are imported, so the client starts about as fast as Python itself.
+If no server is listening, the client runs the command line itself just like while.py.
+"""
+
+import _socket # socket imports a dozen more modules
+import marshal
+import os
+import sys
+
+def socket_path():
+    if path := os.environ.get("WHILEC_SOCKET"):
+        return path
+    if runtime := os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(runtime, "whilec.sock")
+    return f"/tmp/whilec-{os.getuid()}.sock"
+
+# messages are marshalled and preceded by their size
+
+def send(sock, msg):
+    data = marshal.dumps(msg)
+    sock.sendall(len(data).to_bytes(8, "little") + data)
+
+def recv_exactly(sock, size):
+    """Receives size bytes into one buffer instead of concatenating chunks, which copies all bytes received so far each time."""
+    data = bytearray(size)
+    view = memoryview(data)
+    done = 0
+    while done < size:
+        if (num := sock.recv_into(view[done:])) == 0:
+            return None
+        done += num
+    return data
+
+def recv(sock):
+    """Returns the next message or None if the other side hung up."""
+    if (header := recv_exactly(sock, 8)) is None:
+        return None
+    if (data := recv_exactly(sock, int.from_bytes(header, "little"))) is None:
+        return None
+    return marshal.loads(data)
+
+def main():
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+        send(sock, {"argv": sys.argv[1:], "cwd": os.getcwd(), "cc": os.environ.get("CC")})
+        reply = recv(sock)
+    except OSError:
+        reply = None
+    finally:
+        sock.close()
+
+    if reply is None:
+        import driver # pylint: disable=import-outside-toplevel # only without server
+        driver.main()
+        return
+    sys.stdout.buffer.write(reply["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(reply["stderr"])
+    sys.exit(reply["status"])
+
+if __name__ == "__main__":
+    main()
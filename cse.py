@@ -0,0 +1,194 @@
+"""
+Common-subexpression elimination within basic blocks and hash-consing of all expressions of a checked Prog.
+
+A basic block is a maximal run of DeclStmts and AssignStmts in a StmtList, including the condition of an if ending it
+and - at the outermost level - the return expression. Expressions are numbered by operator and the numbers of their
+operands; a variable gets a new number whenever it is assigned, which kills all expressions reading it.
+A BinExpr or UnaryExpr whose number occurs more than once in a block is computed once into a new variable.
+
+Afterwards, structurally identical expressions are interned, so the tree becomes a DAG in which each distinct
+expression exists only once. Nothing may rewrite expressions in place after that.
+"""
+
+from tok import Tok
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, UnaryExpr, BoolExpr, LitExpr, SymExpr
+import trampoline
+
+def root(stmt):
+    if isinstance(stmt, Prog):                 return stmt.ret
+    if isinstance(stmt, (IfStmt, IfElseStmt)): return stmt.cond
+    return stmt.init
+
+def set_root(stmt, expr):
+    if isinstance(stmt, Prog):
+        stmt.ret = expr
+    elif isinstance(stmt, (IfStmt, IfElseStmt)):
+        stmt.cond = expr
+    else:
+        stmt.init = expr
+
+class Eliminator: # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.version  = {} # DeclStmt -> number of assignments so far
+        self.table    = {} # key -> value number; per block
+        self.vns      = {} # Expr -> value number; per block
+        self.interned = {} # key -> Expr
+        self.num_vars       = 0 # new variables
+        self.num_eliminated = 0 # expressions replaced by one of them
+        self.num_exprs      = 0 # expression nodes visited while interning
+        self.num_shared     = 0 # expression nodes replaced by an identical one
+
+    def prog(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.stmt(prog.stmt, prog))
+
+    def intern_prog(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.intern_stmt(prog.stmt))
+        prog.ret = trampoline.run(self.intern(prog.ret))
+
+    # CSE
+
+    def stmt(self, stmt, prog=None):
+        """Splits the StmtList stmt into blocks; prog adds its return expression to the last one."""
+        assert isinstance(stmt, StmtList)
+        (stmts, block) = ([], [])
+        for s in stmt.stmts:
+            if isinstance(s, WhileStmt):
+                yield self.block(block, stmts)
+                block = []
+                stmts.append(s)
+                yield self.stmt(s.body)
+                continue
+
+            block.append(s)
+            if isinstance(s, (IfStmt, IfElseStmt)):
+                yield self.block(block, stmts)
+                block = []
+                yield self.stmt(s.body)
+                if isinstance(s, IfElseStmt):
+                    yield self.stmt(s.alt_body)
+
+        if prog is not None:
+            block.append(prog)
+        yield self.block(block, stmts)
+        stmt.stmts = stmts
+
+    def block(self, block, stmts):
+        """Appends the statements of block to stmts - preceded by new variables for their common subexpressions."""
+        (self.table, self.vns) = ({}, {})
+        first = {} # value number -> [Expr, statement it first occurs in, number of occurrences]
+        for s in block:
+            yield self.number(root(s))
+            yield self.count(root(s), s, first)
+            if isinstance(s, DeclStmt):   self.version[s]      = self.version.get(s, 0) + 1
+            if isinstance(s, AssignStmt): self.version[s.decl] = self.version.get(s.decl, 0) + 1
+
+        (temps, before) = ({}, {})
+        for (vn, (expr, s, num)) in first.items(): # in post order, so operands come first
+            if num > 1:
+                tok  = Tok(expr.loc, f"t_cse_{self.num_vars}")
+                decl = DeclStmt(expr.loc, expr.ty, tok, expr)
+                temps[vn] = decl
+                before.setdefault(s, []).append(decl)
+                self.num_vars       += 1
+                self.num_eliminated += num - 1
+
+        for s in block:
+            if temps:
+                for decl in before.get(s, ()):
+                    yield self.rewrite_kids(decl.init, temps)
+                set_root(s, (yield self.rewrite(root(s), temps)))
+            stmts.extend(before.get(s, ()))
+            if not isinstance(s, Prog):
+                stmts.append(s)
+
+    def number(self, expr):
+        """Returns the value number of expr and records it in self.vns."""
+        if isinstance(expr, BinExpr):
+            key = (expr.op, (yield self.number(expr.lhs)), (yield self.number(expr.rhs)))
+        elif isinstance(expr, UnaryExpr):
+            key = (expr.op, (yield self.number(expr.rhs)))
+        elif isinstance(expr, SymExpr):
+            key = (SymExpr, expr.decl, self.version.get(expr.decl, 0))
+        else:
+            key = (type(expr), expr.val)
+        vn = self.table.setdefault(key, len(self.table))
+        self.vns[expr] = vn
+        return vn
+
+    def count(self, expr, stmt, first):
+        """Counts the occurrences of expr; the operands of a repeated occurrence are not counted again."""
+        if not isinstance(expr, (BinExpr, UnaryExpr)):
+            return
+        vn = self.vns[expr]
+        if vn in first:
+            first[vn][2] += 1
+            return
+        if isinstance(expr, BinExpr):
+            yield self.count(expr.lhs, stmt, first)
+        yield self.count(expr.rhs, stmt, first)
+        first[vn] = [expr, stmt, 1]
+
+    def rewrite(self, expr, temps):
+        if (decl := temps.get(self.vns.get(expr))) is not None:
+            sym      = SymExpr(expr.loc, decl.sym)
+            sym.decl = decl
+            sym.ty   = decl.ty
+            return sym
+        yield self.rewrite_kids(expr, temps)
+        return expr
+
+    def rewrite_kids(self, expr, temps):
+        if isinstance(expr, BinExpr):
+            expr.lhs = yield self.rewrite(expr.lhs, temps)
+        if isinstance(expr, (BinExpr, UnaryExpr)):
+            expr.rhs = yield self.rewrite(expr.rhs, temps)
+
+    # hash-consing
+
+    def intern_stmt(self, stmt):
+        if isinstance(stmt, StmtList):
+            for s in stmt.stmts:
+                yield self.intern_stmt(s)
+        elif isinstance(stmt, (DeclStmt, AssignStmt)):
+            stmt.init = yield self.intern(stmt.init)
+        elif isinstance(stmt, (WhileStmt, IfStmt, IfElseStmt)):
+            stmt.cond = yield self.intern(stmt.cond)
+            yield self.intern_stmt(stmt.body)
+            if isinstance(stmt, IfElseStmt):
+                yield self.intern_stmt(stmt.alt_body)
+        else:
+            assert False
+
+    def intern(self, expr):
+        """Returns the canonical Expr structurally identical to expr."""
+        self.num_exprs += 1
+        if isinstance(expr, BinExpr):
+            expr.lhs = yield self.intern(expr.lhs)
+            expr.rhs = yield self.intern(expr.rhs)
+            key = (expr.op, id(expr.lhs), id(expr.rhs)) # interned operands stay alive in self.interned
+        elif isinstance(expr, UnaryExpr):
+            expr.rhs = yield self.intern(expr.rhs)
+            key = (expr.op, id(expr.rhs))
+        elif isinstance(expr, SymExpr):
+            key = (SymExpr, expr.decl)
+        else:
+            assert isinstance(expr, (BoolExpr, LitExpr))
+            key = (type(expr), expr.val)
+
+        res = self.interned.setdefault(key, expr)
+        if res is not expr:
+            self.num_shared += 1
+        return res
+
+def eliminate(prog):
+    """Eliminates common subexpressions of prog in place and returns the Eliminator with its statistics."""
+    elim = Eliminator()
+    elim.prog(prog)
+    prog.check() # assign slots to the new variables
+    elim.intern_prog(prog)
+    return elim
@@ -0,0 +1,190 @@
+"""
+Dead-store and unused-declaration elimination based on a backward liveness analysis of a checked Prog.
+
+Evaluating an expression has no side effects in While, so a store whose value is never read again can simply go.
+A declaration whose variable is never referenced afterwards is removed as a whole.
+If the variable is still used but the initial value is dead, the declaration takes the place of the assignment
+that overwrites the value if this follows in the same block; otherwise only the initializer is replaced by a constant.
+"""
+
+from tok import Tag
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    UnaryExpr, LitExpr, BoolExpr, SymExpr
+import opt
+import trampoline
+
+def uses(expr):
+    """DeclStmts of all variables read in expr."""
+    res   = set()
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, SymExpr):
+            res.add(expr.decl)
+        else:
+            stack.extend(opt.kids(expr))
+    return res
+
+class Eliminator:
+    def __init__(self):
+        self.reads  = {}    # WhileStmt -> DeclStmts declared outside of it and read anywhere in it
+        self.writes = {}    # StmtList -> DeclStmts declared outside of it and assigned anywhere in it
+        self.refs   = set() # DeclStmts referenced by a statement that is kept
+        self.dead   = set() # DeclStmts referenced by a statement that is kept whose initializer is dead
+        self.num_stores   = 0 # assignments removed or initializers replaced
+        self.num_decls    = 0 # declarations removed
+        self.num_branches = 0 # ifs removed as their bodies became empty
+
+    def prog(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.read(prog.stmt))
+        live = self.use(prog.ret, set())
+        prog.stmt = trampoline.run(self.stmt(prog.stmt, live))
+
+    def use(self, expr, live):
+        res = uses(expr)
+        live.update(res)
+        self.refs.update(res)
+        return live
+
+    def read(self, stmt):
+        """
+        Collects self.reads and self.writes; returns the DeclStmts declared outside of stmt that are read resp. assigned in it.
+        Leaving out variables declared within keeps these sets small - and the pass linear - even for deeply nested loops.
+        """
+        if isinstance(stmt, StmtList):
+            (reads, writes) = (set(), set())
+            for s in stmt.stmts:
+                (r, w) = yield self.read(s)
+                reads.update(r)
+                writes.update(w)
+            for s in stmt.stmts:
+                if isinstance(s, DeclStmt):
+                    reads.discard(s)
+                    writes.discard(s)
+            self.writes[stmt] = writes
+            return (reads, writes)
+        if isinstance(stmt, DeclStmt):
+            return (uses(stmt.init), set())
+        if isinstance(stmt, AssignStmt):
+            return (uses(stmt.init), {stmt.decl})
+        if isinstance(stmt, WhileStmt):
+            (reads, writes) = yield self.read(stmt.body)
+            reads = uses(stmt.cond) | reads
+            self.reads[stmt] = reads
+            return (reads, writes)
+        if isinstance(stmt, (IfStmt, IfElseStmt)):
+            (reads, writes) = yield self.read(stmt.body)
+            (reads, writes) = (uses(stmt.cond) | reads, set(writes))
+            if isinstance(stmt, IfElseStmt):
+                (r, w) = yield self.read(stmt.alt_body)
+                reads.update(r)
+                writes.update(w)
+            return (reads, writes)
+        assert False
+
+    # stmt
+    #
+    # stmt turns the set live of variables live after stmt into the one before it
+    # and returns the statement to keep in place of stmt or None if it is gone.
+    # All variables declared outside of a loop and read within it are considered live throughout it
+    # instead of iterating to a fixed point; this is conservative and keeps the pass linear in the size of loop bodies.
+    # A body only gets those live variables it may assign, as nothing else of its live set matters afterwards.
+
+    def stmt(self, stmt, live):
+        if isinstance(stmt, StmtList):
+            stmts = []
+            for s in reversed(stmt.stmts):
+                if (s := (yield self.stmt(s, live))) is not None:
+                    stmts.append(s)
+            stmts.reverse()
+            stmt.stmts = self.sink(stmts)
+            return stmt
+        if isinstance(stmt, DeclStmt):
+            if stmt in live:
+                live.discard(stmt)
+                self.use(stmt.init, live)
+                return stmt
+            if stmt not in self.refs:
+                self.num_decls += 1
+                return None
+            self.dead.add(stmt) # the variable is overwritten before it is read
+            return stmt
+        if isinstance(stmt, AssignStmt):
+            if stmt.decl not in live:
+                self.num_stores += 1
+                return None
+            live.discard(stmt.decl)
+            self.refs.add(stmt.decl)
+            self.use(stmt.init, live)
+            return stmt
+        if isinstance(stmt, WhileStmt):
+            live.update(self.reads[stmt])
+            self.refs.update(self.reads[stmt])
+            yield self.stmt(stmt.body, live & self.writes[stmt.body])
+            return stmt
+        if isinstance(stmt, IfStmt):
+            body = live & self.writes[stmt.body]
+            yield self.stmt(stmt.body, body)
+            if not stmt.body.stmts:
+                self.num_branches += 1
+                return None
+            live.update(body)
+            self.use(stmt.cond, live)
+            return stmt
+        if isinstance(stmt, IfElseStmt):
+            (body, alt) = (live & (self.writes[stmt.body] | self.writes[stmt.alt_body]), live) # alt may kill what body keeps
+            yield self.stmt(stmt.body, body)
+            yield self.stmt(stmt.alt_body, alt)
+            if not stmt.body.stmts and not stmt.alt_body.stmts:
+                self.num_branches += 1
+                return None
+            live.update(body)
+            self.use(stmt.cond, live)
+            if not stmt.alt_body.stmts:
+                return IfStmt(stmt.loc, stmt.cond, stmt.body)
+            if not stmt.body.stmts:
+                cond    = UnaryExpr(stmt.cond.loc, Tag.K_NOT, stmt.cond)
+                cond.ty = Tag.K_BOOL
+                return IfStmt(stmt.loc, cond, stmt.alt_body)
+            return stmt
+        assert False
+
+    def sink(self, stmts):
+        """
+        Moves each declaration in stmts whose initializer is dead down to the assignment that overwrites it,
+        provided that only declarations and assignments come in between - anything else might assign it in a branch.
+        The initializers of all other such declarations are replaced by constants.
+        """
+        res     = []
+        pending = {} # DeclStmt in self.dead -> its index in res
+        for s in stmts:
+            if isinstance(s, AssignStmt) and s.decl in pending:
+                res[pending.pop(s.decl)] = None
+                self.dead.discard(s.decl)
+                s.decl.init = s.init
+                s = s.decl
+                self.num_stores += 1
+            elif isinstance(s, DeclStmt) and s in self.dead:
+                pending[s] = len(res)
+            elif not isinstance(s, (DeclStmt, AssignStmt)):
+                pending.clear()
+            res.append(s)
+
+        for s in stmts:
+            if isinstance(s, DeclStmt) and s in self.dead:
+                self.dead.discard(s)
+                if not opt.is_const(s.init):
+                    s.init    = LitExpr(s.init.loc, 0) if s.ty is Tag.K_INT else BoolExpr(s.init.loc, False)
+                    s.init.ty = s.ty
+                    self.num_stores += 1
+        return [s for s in res if s is not None]
+
+def eliminate(prog):
+    """Removes dead code from prog in place and returns the Eliminator with its statistics."""
+    elim = Eliminator()
+    elim.prog(prog)
+    prog.check() # compact the slots of the remaining variables
+    return elim
@@ -0,0 +1,406 @@
+"""
+Runs the phases requested on the command line of while.py for one input file - or for many of them in a process pool.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import glob
+import io
+import os
+import shutil
+import sys
+
+import accum
+import cache
+import cse
+import dead
+import err
+import ir
+import loops
+import native
+import opt
+import profiler
+import vm
+import while_ast
+from parse import Parser
+
+# options naming an output file and the extension of this output in batch mode, where they name a directory instead
+OUTPUTS = {
+    "output":    ".while",
+    "output_c":  ".c",
+    "output_py": ".py",
+    "output_bc": ".wbc",
+    "emit_bc":   ".bc",
+    "emit_ir":   ".ir",
+    "profile_stacks": ".stacks",
+}
+
+cli = argparse.ArgumentParser(
+    prog="while.py", # also when server.py runs it
+    description="Compiler and interpreter for the While languge.",
+    epilog="Use '-' to output to stdout.")
+
+cli.add_argument(      "--eval",          action="store", metavar="engine", dest="eval",      help="interpret input program with 'tree' (default), 'closure', 'vm' or 'ir' engine",
+                                           nargs="?", const="tree", choices=["tree", "closure", "vm", "ir"])
+cli.add_argument(      "--profile",       action="store_true",              dest="profile",   help="with --eval: report the time spent in each statement on stderr")
+cli.add_argument(      "--profile-stacks", action="store", metavar="output", dest="profile_stacks",
+                                           help="with --eval: write the time spent in each statement as collapsed stacks for flame graphs")
+cli.add_argument("-o", "--output",        action="store", metavar="output", dest="output",    help="print program again")
+cli.add_argument(      "--output-c",      action="store", metavar="output", dest="output_c",  help="compile program to C")
+cli.add_argument(      "--output-py",     action="store", metavar="output", dest="output_py", help="compile program to Python")
+cli.add_argument(      "--output-bc",     action="store", metavar="output", dest="output_bc", help="compile program to a bytecode file")
+cli.add_argument(      "--emit-bytecode", action="store", metavar="output", dest="emit_bc",   help="print bytecode of program")
+cli.add_argument(      "--emit-ir",       action="store", metavar="output", dest="emit_ir",   help="print SSA intermediate representation of program")
+cli.add_argument(      "--ir",            action="store_true",              dest="ir",        help="compile to C and Python via the intermediate representation")
+cli.add_argument(      "--eval-py",       action="store_true",              dest="eval_py",   help="compile program to Python and run it in-process")
+cli.add_argument(      "--run-c",         action="store_true",              dest="run_c",     help="compile program to C, build it with the C compiler and run it; executables are cached")
+cli.add_argument(      "--cc",            action="store", metavar="compiler", dest="cc",      help="C compiler for --run-c (default: $CC or 'cc')",
+                                           default=os.environ.get("CC") or "cc")
+cli.add_argument(      "--cc-opt",        action="store", metavar="level",  dest="cc_opt",    help="optimization level of the C compiler for --run-c (default: 2)",
+                                           default="2", choices=["0", "1", "2", "3", "s"])
+cli.add_argument(      "--no-cache",      action="store_true",              dest="no_cache",  help="neither use nor update the compilation cache")
+cli.add_argument("-O",                    action="store", metavar="level",  dest="opt",       help="optimization level: 0 (none), 1 (constant folding, dead code elimination, default) or 2 (also loop optimizations and CSE)",
+                                           type=int, default=1, choices=[0, 1, 2])
+cli.add_argument("-v", "--verbose",       action="store_true",              dest="verbose",   help="report statistics of the optimizer on stderr")
+cli.add_argument(      "--max-errors",    action="store", metavar="N",      dest="max_errors", help="stop compiling after N errors (default: 0, no limit)",
+                                           type=int, default=0)
+cli.add_argument(      "--error-format",  action="store", metavar="format", dest="error_format", help="print errors as 'text' (default) or as 'json' lines",
+                                           default="text", choices=["text", "json"])
+cli.add_argument("-j", "--jobs",          action="store", metavar="jobs",   dest="jobs",      help="compile in batch mode with this many processes (default: number of CPUs); "
+                                                                                                   "outputs then name directories",
+                                           type=int)
+cli.add_argument("file",                  nargs="+",                                          help="input files (While source or bytecode files); "
+                                                                                                   "several files, directories or glob patterns select batch mode")
+
+def open_output(filename):
+    if filename == "-":
+        return contextlib.nullcontext(sys.stdout)
+    return open(filename, "w", encoding='ASCII')
+
+def optimize(prog, level, verbose):
+    num_nodes = opt.size(prog) if verbose else 0
+    folder    = opt.fold(prog)
+    if verbose:
+        print(f"fold: folded {folder.num_folded} expression(s), pruned {folder.num_pruned} statement(s), "
+              f"eliminated {num_nodes - opt.size(prog)} of {num_nodes} node(s)", file=sys.stderr)
+
+    if level > 1:
+        summarizer = accum.summarize(prog)
+        if verbose:
+            print(f"accum: summarized {len(summarizer.summarized)} loop(s)", file=sys.stderr)
+            for loop in summarizer.summarized:
+                print(f"    {loop.loc}: replaced by closed form", file=sys.stderr)
+
+        loop = loops.optimize(prog)
+        if verbose:
+            print(f"loops: hoisted {loop.num_hoisted} invariant expression(s), "
+                  f"strength-reduced {loop.num_reduced} multiplication(s)", file=sys.stderr)
+
+    elim = dead.eliminate(prog)
+    if verbose:
+        print(f"dead: removed {elim.num_stores} dead store(s), {elim.num_decls} unused declaration(s) "
+              f"and {elim.num_branches} empty if statement(s)", file=sys.stderr)
+
+    if level > 1:
+        elim = cse.eliminate(prog)
+        if verbose:
+            print(f"cse: eliminated {elim.num_eliminated} common subexpression(s) into {elim.num_vars} variable(s), "
+                  f"shared {elim.num_shared} of {elim.num_exprs} expression node(s)", file=sys.stderr)
+
+class Driver:
+    """
+    Everything while.py does with the file args.file. Each phase runs at most once and only if an output needs it;
+    errors end the process via sys.exit.
+    """
+
+    def __init__(self, args, text = None):
+        self.args  = args
+        self.text  = text # of args.file, which is read if None
+        self.entry = None
+        # a worker process compiles many files
+        err.DIAGS              = err.Diagnostics(args.error_format, args.max_errors or None)
+        while_ast.DECL_COUNTER = 0
+
+    def run(self):
+        args = self.args
+        if (args.profile or args.profile_stacks is not None) and args.eval not in ("tree", "closure"):
+            sys.exit("error: --profile and --profile-stacks need --eval with the 'tree' or 'closure' engine")
+        if self.text is None:
+            if vm.is_bytecode(args.file):
+                self.run_bytecode()
+                return
+            with open(args.file, "r", encoding='ASCII') as in_file:
+                self.text = in_file.read()
+        self.entry = None if args.no_cache else cache.Entry(args.file, self.text, args.opt)
+        backend = (lambda: self.function) if args.ir else (lambda: self.program)
+
+        self.output(args.output, "while", while_ast.Emit.WHILE, lambda: self.checked)
+
+        if args.eval is not None:
+            while_ast.EMIT = while_ast.Emit.EVAL
+            if args.profile or args.profile_stacks is not None:
+                self.profile()
+            elif args.eval == "ir":
+                print(self.function.run())
+            elif args.eval == "closure":
+                print(self.program.closure()())
+            elif args.eval == "vm":
+                print(self.bytecode.run())
+            else:
+                print(self.program.eval())
+
+        if args.eval_py:
+            src = self.render("ir.py" if args.ir else "py", while_ast.Emit.PY, backend)
+            try:
+                code = compile(src, f"{args.file}.py", "exec")
+            except (SyntaxError, RecursionError, MemoryError) as error: # e.g. too many statically nested blocks
+                reason = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__ # a MemoryError has no message
+                sys.exit(f"error: cannot compile Python output ({reason}); "
+                         f"the program is too large for the Python backend, use --eval or --run-c instead")
+            scope = {"__name__": "while"} # keeps the output from running main itself
+            exec(code, scope) # pylint: disable=exec-used
+            print(scope["main"]())
+
+        if args.run_c:
+            try:
+                print(native.run(self.render("ir.c" if args.ir else "c", while_ast.Emit.C, backend), args.cc, args.cc_opt))
+            except native.Error as error:
+                sys.exit(f"error: {error}")
+
+        if args.emit_bc is not None or args.output_bc is not None:
+            self.output_bc(self.bytecode)
+
+        self.output(args.emit_ir,   "ir",                          while_ast.Emit.IR, lambda: self.function)
+        self.output(args.output_c,  "ir.c"  if args.ir else "c",  while_ast.Emit.C,  backend)
+        self.output(args.output_py, "ir.py" if args.ir else "py", while_ast.Emit.PY, backend)
+
+        if all(getattr(args, dest) is None for dest in OUTPUTS) and args.eval is None and not args.eval_py and not args.run_c:
+            self.program # pylint: disable=pointless-statement # nothing to do but report errors
+
+    def run_bytecode(self):
+        args = self.args
+        if any(out is not None for out in (args.output, args.output_c, args.output_py, args.emit_ir)) \
+                or args.eval_py or args.run_c:
+            sys.exit("error: cannot compile a bytecode file to source code")
+        if args.profile or args.profile_stacks is not None:
+            sys.exit("error: cannot profile a bytecode file")
+        with open(args.file, "rb") as in_file:
+            code = vm.Code.load(in_file)
+        self.output_bc(code)
+        if args.eval is not None:
+            print(code.run())
+
+    def profile(self):
+        args = self.args
+        prof = profiler.Profiler(self.program)
+        print(prof.run(args.eval == "closure"))
+        if args.profile:
+            prof.report(sys.stderr)
+        if args.profile_stacks is not None:
+            with open_output(args.profile_stacks) as out_file:
+                prof.dump(out_file)
+
+    def output_bc(self, code):
+        args = self.args
+        if args.emit_bc is not None:
+            with open_output(args.emit_bc) as out_file:
+                out_file.write(str(code))
+
+        if args.output_bc is not None:
+            if args.output_bc == "-":
+                code.save(sys.stdout.buffer)
+            else:
+                with open(args.output_bc, "wb") as out_file:
+                    code.save(out_file)
+
+    def render(self, kind, emit, node):
+        """Returns node() emitted as emit - from the cache if possible."""
+        text = None if self.entry is None else self.entry.get(kind)
+        if text is None:
+            while_ast.EMIT = emit
+            text = str(node())
+            if self.entry is not None:
+                self.entry.put(kind, text)
+        return text
+
+    def output(self, filename, kind, emit, node):
+        """Writes node() emitted as emit to filename in one pass - copied from the cache if possible."""
+        if filename is None:
+            return
+        cached = None if self.entry is None else self.entry.open(kind)
+        if cached is None:
+            while_ast.EMIT = emit
+            res = node() # before the output file is created, as this may fail
+            if self.entry is not None:
+                self.entry.write(kind, res.write)
+                cached = self.entry.open(kind)
+        with open_output(filename) as out_file:
+            if cached is None: # not cached or evicted right away
+                res.write(out_file)
+            else:
+                with cached:
+                    shutil.copyfileobj(cached, out_file)
+
+    @functools.cached_property
+    def parse(self):
+        src_file      = io.StringIO(self.text)
+        src_file.name = self.args.file
+        try:
+            prog = Parser(src_file).parse_prog()
+        except err.TooManyErrors:
+            self.abort()
+        return prog
+
+    @functools.cached_property
+    def checked(self):
+        """The parsed and checked Prog before optimization; errors end the process, so nothing erroneous is ever output or cached."""
+        prog = self.parse
+        try:
+            prog.check()
+        except err.TooManyErrors:
+            self.abort()
+        if err.DIAGS.num_errors != 0:
+            err.DIAGS.flush()
+            sys.exit(f"error: aborting due to {err.DIAGS.num_errors} error(s)")
+        return prog
+
+    @functools.cached_property
+    def program(self):
+        """The checked and optimized Prog."""
+        args = self.args
+        prog = None if self.entry is None or args.verbose else self.entry.get_prog()
+        if prog is not None:
+            prog.check()
+            return prog
+
+        prog = self.checked
+        if args.opt > 0:
+            optimize(prog, args.opt, args.verbose)
+        if self.entry is not None:
+            self.entry.put_prog(prog)
+        return prog
+
+    @staticmethod
+    def abort():
+        err.DIAGS.flush()
+        sys.exit(f"error: aborting after the first {err.DIAGS.num_errors} error(s)")
+
+    @functools.cached_property
+    def function(self):
+        return ir.lower(self.program)
+
+    @functools.cached_property
+    def bytecode(self):
+        code = None if self.entry is None or self.args.verbose else self.entry.get_code()
+        if code is None:
+            code = vm.compile_prog(self.program)
+            if self.entry is not None:
+                self.entry.put_code(code)
+        return code
+
+# batch mode
+
+def is_batch(args):
+    return args.jobs is not None or len(args.file) != 1 or os.path.isdir(args.file[0]) or is_pattern(args.file[0])
+
+def is_pattern(path):
+    return not os.path.exists(path) and any(c in path for c in "*?[")
+
+def inputs(paths):
+    """Yields each input file with the directory its outputs are named relative to."""
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, dirs, files) in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(".while"):
+                        yield (os.path.join(root, name), path)
+        elif is_pattern(path):
+            for name in sorted(glob.glob(path, recursive=True)):
+                yield (name, os.path.dirname(name))
+        else:
+            yield (path, os.path.dirname(path))
+
+def file_args(args, filename, base):
+    """The args of filename in batch mode: each output goes to the directory named by its option."""
+    res      = argparse.Namespace(**vars(args))
+    res.file = filename
+    stem     = os.path.splitext(os.path.relpath(filename, base or "."))[0]
+    for (dest, ext) in OUTPUTS.items():
+        if (out_dir := getattr(args, dest)) is not None:
+            setattr(res, dest, os.path.join(out_dir, stem + ext))
+    return res
+
+def exit_status(exit_):
+    """The exit status of SystemExit exit_; prints its message to stderr just like the interpreter would."""
+    if exit_.code is None or isinstance(exit_.code, int):
+        return exit_.code or 0
+    print(exit_.code, file=sys.stderr)
+    return 1
+
+def compile_file(args):
+    """Runs Driver(args) and returns the exit status, the number of errors and everything it printed."""
+    (out, error) = (io.StringIO(), io.StringIO())
+    status = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(error):
+        try:
+            for dest in OUTPUTS:
+                if (filename := getattr(args, dest)) is not None:
+                    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            Driver(args).run()
+        except SystemExit as exit_:
+            status = exit_status(exit_)
+        except OSError as os_error:
+            status = 1
+            print(f"error: {os_error}", file=sys.stderr)
+    return (status, err.DIAGS.num_errors, out.getvalue(), error.getvalue())
+
+def plan(args):
+    """Returns the args of each file given by args - making sure no output overwrites another or an input."""
+    for dest in OUTPUTS:
+        if getattr(args, dest) == "-":
+            sys.exit("error: outputs name directories in batch mode and cannot go to stdout")
+    jobs    = [file_args(args, filename, base) for (filename, base) in inputs(args.file)]
+    targets = {}
+    for job in jobs:
+        for dest in OUTPUTS:
+            if (filename := getattr(job, dest)) is not None:
+                if os.path.abspath(filename) == os.path.abspath(job.file):
+                    sys.exit(f"error: output '{filename}' would overwrite its input")
+                if (other := targets.setdefault(os.path.abspath(filename), job.file)) != job.file:
+                    sys.exit(f"error: '{other}' and '{job.file}' would both be written to '{filename}'")
+    if not jobs:
+        sys.exit("error: no input files")
+    return jobs
+
+def batch(args):
+    """Compiles all files given by args with args.jobs processes and returns the combined exit status."""
+    jobs     = plan(args)
+    num_jobs = args.jobs or os.cpu_count() or 1
+    failed   = [] # (file, number of errors)
+    with concurrent.futures.ProcessPoolExecutor(num_jobs) as pool:
+        results = pool.map(compile_file, jobs, chunksize=max(1, len(jobs) // (4 * num_jobs)))
+        for (job, (status, num_errors, out, error)) in zip(jobs, results): # in order, as soon as available
+            for line in out.splitlines(keepends=True): # diagnostics name their file anyway
+                sys.stdout.write(line if line.startswith((job.file + ":", '{"file": ')) else f"{job.file}: {line}")
+            sys.stderr.write(error)
+            if status != 0:
+                failed.append((job.file, num_errors))
+
+    if failed:
+        print(f"error: {len(failed)} of {len(jobs)} file(s) failed with {sum(n for (_, n) in failed)} error(s)",
+              file=sys.stderr)
+        for (filename, num_errors) in failed:
+            print(f"    {filename}: {num_errors} error(s)", file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv = None, sources = None):
+    """Runs the command line argv (default: sys.argv[1:]); sources maps input files to their text instead of reading them."""
+    args = cli.parse_args(argv)
+    if is_batch(args):
+        sys.exit(batch(args))
+    args.file = args.file[0]
+    Driver(args, (sources or {}).get(args.file)).run()
@@ -1,13 +1,59 @@
 """
-Helper to emit and keep track of errors.
+Helpers to emit and keep track of errors.
+
+Diagnostics are collected by DIAGS and written to stdout in batches - as text or as JSON lines - instead of one by one.
 """
 
-NUM_ERRORS = 0
+import atexit
+import json
+import sys
+
+BATCH = 4096 # diagnostics written at once
+
+def text(loc, kind, msg):
+    return f"{loc}: {kind}: {msg}"
+
+def json_line(loc, kind, msg):
+    begin = loc.file.pos(loc.begin)
+    finis = loc.file.pos(loc.finis)
+    return json.dumps({"file": str(loc.file), "row": begin.row, "col": begin.col, "end_row": finis.row, "end_col": finis.col,
+                       "kind": kind, "message": msg})
+
+FORMATS = {"text": text, "json": json_line}
+
+class TooManyErrors(Exception):
+    """Raised when another error is reported although max_errors errors have been reported already."""
+
+class Diagnostics:
+    def __init__(self, fmt = "text", max_errors = None, batch = BATCH):
+        self.format     = FORMATS[fmt]
+        self.max_errors = max_errors # None for no limit
+        self.batch      = batch      # None keeps all diagnostics in diags instead of writing them
+        self.diags      = []         # (loc, kind, message) not written yet
+        self.num_errors = 0
+
+    def report(self, loc, kind, msg):
+        if kind == "error":
+            if self.num_errors == self.max_errors: # notes of the last error still make it
+                raise TooManyErrors()
+            self.num_errors += 1
+        self.diags.append((loc, kind, msg))
+        if self.batch is not None and len(self.diags) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.batch is not None and self.diags:
+            sys.stdout.write("".join(self.format(*diag) + "\n" for diag in self.diags))
+            self.diags.clear()
+
+DIAGS = Diagnostics()
+
+@atexit.register
+def flush():
+    DIAGS.flush()
 
-def err(loc, *args, **kwargs):
-    global NUM_ERRORS
-    NUM_ERRORS += 1
-    print(f"{loc}: error: "+" ".join(map(str, args)), **kwargs)
+def err(loc, *args):
+    DIAGS.report(loc, "error", " ".join(map(str, args)))
 
-def note(loc, *args, **kwargs):
-    print(f"{loc}: note: "+" ".join(map(str, args)), **kwargs)
+def note(loc, *args):
+    DIAGS.report(loc, "note", " ".join(map(str, args)))
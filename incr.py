@@ -0,0 +1,296 @@
+"""
+Incremental front end for editors: keeps a program parsed and checked while its text is edited.
+
+The text of a Document is cut into Pieces, one per top-level statement plus a final one for the return.
+Each Piece is the Source of the locations within it, so pieces in front of or behind an edit stay valid as they are.
+An edit relexes and reparses only the pieces it touches - and as many following ones as it takes for the statements
+to end where a piece used to -, and rechecks only the new pieces as well as those that look up a name
+whose top-level declarations changed; all other statements are reused along with what Sema found out about them.
+
+Top-level variables get slots of their own that do not depend on their order, and all inner scopes start behind them,
+so the Prog of a Document can be run just like a parsed one.
+"""
+
+import collections
+import io
+from bisect import bisect_right
+from itertools import accumulate
+
+from loc import Loc, Source
+from parse import Parser
+from tok import Tag
+from while_ast import Prog, DeclStmt, AssignStmt, StmtList, SymExpr, Sema
+import err
+import opt
+import trampoline
+
+KEY_GAP = 1 << 32 # between the keys of neighboring pieces after renumbering
+
+class Piece(Source):
+    __slots__ = ("doc", "key", "node", "uses", "diags", "checks")
+
+    def __init__(self, doc, text, node):
+        super().__init__(doc.name, text)
+        self.doc    = doc
+        self.key    = 0     # orders the pieces of doc
+        self.node   = node  # top-level Stmt or, in the last piece, the return Expr
+        self.uses   = set() # names looked up in the root scope
+        self.diags  = []    # (loc, kind, message) of the parser
+        self.checks = []    # (loc, kind, message) of Sema
+
+    def pos(self, offset):
+        return self.doc.source.pos(self.doc.offset(self) + offset)
+
+class Root:
+    """The root scope as seen from piece: the first top-level declaration of each name in front of it."""
+
+    def __init__(self, doc, piece):
+        self.doc   = doc
+        self.piece = piece
+
+    def __contains__(self, sym):
+        if sym not in self.piece.uses:
+            self.piece.uses.add(sym)
+            self.doc.users[sym].add(self.piece)
+        return self.doc.lookup(sym, self.piece) is not None
+
+    def __getitem__(self, sym):
+        return self.doc.lookup(sym, self.piece)
+
+    def __setitem__(self, sym, decl):
+        pass # top-level declarations are registered by Document.replace
+
+class PieceSema(Sema):
+    """Sema for the node of one piece."""
+
+    def __init__(self, doc, piece):
+        super().__init__()
+        self.scopes[0] = Root(doc, piece)
+        self.num_slots = doc.base
+        self.max_slots = doc.base
+
+    def alloc(self, decl):
+        if len(self.scopes) > 1: # the Document has already given a slot to a top-level variable
+            super().alloc(decl)
+
+def relocate(node, piece, begin, seen):
+    """
+    Makes the locations of all nodes below node relative to piece, which starts at begin;
+    seen holds the ids of those done already, as a token may be shared with the next piece.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        locs = [node.loc]
+        if isinstance(node, (DeclStmt, AssignStmt, SymExpr)):
+            locs.append(node.sym.loc)
+        for loc in locs:
+            if id(loc) not in seen:
+                seen.add(id(loc))
+                (loc.file, loc.begin, loc.finis) = (piece, loc.begin - begin, loc.finis - begin)
+        stack.extend(opt.kids(node))
+
+class Document: # pylint: disable=too-many-instance-attributes
+    def __init__(self, name, text):
+        self.name    = name
+        self.text    = text
+        self.source  = Source(name, text)         # the whole text, for rows and columns
+        self.pieces  = []                         # tile the text in order
+        self.sizes   = []                         # length of each piece
+        self.starts  = None                       # piece -> offset in text; built on first use
+        self.decls   = collections.defaultdict(list) # name -> pieces declaring it at top level, in order
+        self.users   = collections.defaultdict(set)  # name -> pieces looking it up in the root scope
+        self.slots   = 0                          # slots handed out to top-level variables so far
+        self.free    = []                         # slots of top-level variables that are gone
+        self.base    = 16                         # first slot of inner scopes
+        self.nested  = 0                          # slots needed by inner scopes
+        loc          = Loc(self.source, 0, 0)
+        self.prog    = Prog(loc, StmtList(loc, []), None)
+        self.replace(0, 0, self.split(text, True))
+
+    def edit(self, offset, removed, inserted):
+        """Replaces removed chars at offset of the text by inserted."""
+        assert 0 <= offset and offset + removed <= len(self.text)
+        self.text = self.text[:offset] + inserted + self.text[offset + removed:]
+        ends      = list(accumulate(self.sizes))
+        last      = len(self.pieces) - 1
+        # the piece in front is included as an 'else' may continue its statement
+        first     = max(min(bisect_right(ends, offset - 1), last) - 1, 0)
+        end       = min(bisect_right(ends, offset + removed), last) + 1
+        begin     = ends[first] - self.sizes[first]
+        size      = ends[end - 1] - begin + len(inserted) - removed
+        more      = 1
+        while (pieces := self.split(self.text[begin:begin + size], end == len(self.pieces))) is None:
+            # doubling keeps this linear if, say, an unclosed '{' swallows the rest of the text
+            size += sum(self.sizes[end:end + more])
+            end   = min(end + more, len(self.pieces))
+            more *= 2
+        self.replace(first, end, pieces)
+
+    def replace(self, first, end, pieces):
+        """Replaces pieces[first:end] by pieces, reusing what is unchanged, and checks what may have changed."""
+        last = end == len(self.pieces)
+        stop = min(end, len(self.prog.stmt.stmts))
+        old  = self.splice(first, end, pieces)
+
+        changed = self.declare(old, pieces)
+        nodes   = [piece.node for piece in pieces]
+        if last:
+            self.prog.ret = nodes.pop()
+        self.prog.stmt.stmts[first:stop] = nodes
+        self.starts        = None
+        self.source        = Source(self.name, self.text)
+        self.prog.loc      = Loc(self.source, 0, max(len(self.text) - 1, 0))
+        self.prog.stmt.loc = self.prog.loc
+
+        if self.slots > self.base: # inner scopes have to move
+            while self.slots > self.base:
+                self.base *= 2
+            todo = self.pieces
+        else:
+            todo  = set(pieces)
+            after = pieces[-1].key
+            for sym in changed:
+                todo.update(piece for piece in self.decls[sym] if piece.key > after)
+                todo.update(piece for piece in self.users[sym] if piece.key > after)
+        for piece in todo:
+            self.check(piece)
+        self.prog.num_slots = self.base + self.nested
+
+    def splice(self, first, end, pieces):
+        """Puts pieces in place of pieces[first:end], which are returned, with keys between those of their neighbors."""
+        lo   = self.pieces[first - 1].key if first > 0 else 0
+        hi   = self.pieces[end].key if end < len(self.pieces) else lo + (len(pieces) + 1) * KEY_GAP
+        step = (hi - lo) // (len(pieces) + 1)
+        for (i, piece) in enumerate(pieces, 1):
+            piece.key = lo + i * step
+
+        old = self.pieces[first:end]
+        self.pieces[first:end] = pieces
+        self.sizes[first:end]  = [len(piece.text) for piece in pieces]
+        if step == 0: # no room left
+            for (i, piece) in enumerate(self.pieces, 1):
+                piece.key = i * KEY_GAP
+        return old
+
+    def split(self, text, last):
+        """
+        Parses text as top-level statements - followed by the return if last - and cuts it into one piece for each.
+        Returns None if they do not end with text, as the parser would have continued into the next piece then.
+        """
+        src      = io.StringIO(text)
+        src.name = self.name
+        (diags, err.DIAGS) = (err.DIAGS, err.Diagnostics(batch=None))
+        try:
+            parser = Parser(src)
+            nodes  = []
+            marks  = [] # diagnostics up to here come from parsing the node
+            while (stmt := trampoline.run(parser.parse_next_stmt())) is not None:
+                nodes.append(stmt)
+                marks.append(len(err.DIAGS.diags))
+            bounds = [0] + [stmt.loc.begin for stmt in nodes[1:]]
+            if last:
+                if nodes:
+                    bounds.append(parser.ahead.loc.begin)
+                nodes.append(trampoline.run(parser.parse_ret()))
+                marks.append(len(err.DIAGS.diags))
+            elif not nodes or not parser.ahead.isa(Tag.M_EOF) or any(loc.begin >= len(text) for (loc, _, _) in err.DIAGS.diags):
+                return None
+            return self.cut(text, nodes, bounds, marks, err.DIAGS.diags)
+        finally:
+            err.DIAGS = diags
+
+    def cut(self, text, nodes, bounds, marks, diags):
+        """Makes a piece of each node, which starts at the same index of bounds, and moves the diagnostics there."""
+        pieces = [Piece(self, text[begin:finis], node) for (begin, finis, node) in zip(bounds, bounds[1:] + [len(text)], nodes)]
+        for (i, (loc, kind, msg)) in enumerate(diags):
+            j = min(bisect_right(marks, i), len(pieces) - 1)
+            if loc.begin < bounds[j]: # an invalid char between the previous statement and this one
+                j = bisect_right(bounds, loc.begin) - 1
+            pieces[j].diags.append((Loc(pieces[j], loc.begin - bounds[j], loc.finis - bounds[j]), kind, msg))
+        seen = set()
+        for (piece, begin) in zip(pieces, bounds):
+            relocate(piece.node, piece, begin, seen)
+        return pieces
+
+    def declare(self, old, new):
+        """
+        Moves the top-level declarations from the old pieces to the new ones and returns the names whose declarations
+        changed; a new declaration of the same name and type replaces the contents of the old DeclStmt instead,
+        so everything referring to it stays valid.
+        """
+        olds = collections.defaultdict(collections.deque)
+        for piece in old:
+            for sym in piece.uses:
+                self.users[sym].discard(piece)
+            if self.is_decl(piece):
+                self.decls[piece.node.sym.sym].remove(piece)
+                olds[(piece.node.sym.sym, piece.node.ty)].append(piece.node)
+
+        changed = set()
+        for piece in new:
+            if not self.is_decl(piece):
+                continue
+            decl = piece.node
+            if olds[(decl.sym.sym, decl.ty)]:
+                prev = olds[(decl.sym.sym, decl.ty)].popleft()
+                (prev.sym, prev.init) = (decl.sym, decl.init)
+                (prev.loc.file, prev.loc.begin, prev.loc.finis) = (decl.loc.file, decl.loc.begin, decl.loc.finis)
+                piece.node = prev
+            else:
+                decl.slot = self.free.pop() if self.free else self.slots
+                self.slots = max(self.slots, decl.slot + 1)
+                changed.add(decl.sym.sym)
+            decls = self.decls[decl.sym.sym]
+            i     = len(decls)
+            while i > 0 and decls[i - 1].key > piece.key:
+                i -= 1
+            decls.insert(i, piece)
+
+        for decls in olds.values():
+            for decl in decls:
+                self.free.append(decl.slot)
+                changed.add(decl.sym.sym)
+        return changed
+
+    @staticmethod
+    def is_decl(piece):
+        return isinstance(piece.node, DeclStmt) and not piece.node.sym.is_error()
+
+    def check(self, piece):
+        for sym in piece.uses:
+            self.users[sym].discard(piece)
+        piece.uses   = set()
+        piece.checks = []
+        if piece.node is None:
+            return
+        sema = PieceSema(self, piece)
+        (diags, err.DIAGS) = (err.DIAGS, err.Diagnostics(batch=None))
+        try:
+            trampoline.run(piece.node.check(sema))
+        finally:
+            (piece.checks, err.DIAGS) = (err.DIAGS.diags, diags)
+        self.nested = max(self.nested, sema.max_slots - self.base)
+
+    def lookup(self, sym, piece):
+        """The top-level declaration of sym visible in piece, if any."""
+        if (decls := self.decls.get(sym)) and decls[0].key < piece.key:
+            return decls[0].node
+        return None
+
+    def offset(self, piece):
+        if self.starts is None:
+            self.starts = dict(zip(self.pieces, accumulate([0] + self.sizes[:-1])))
+        return self.starts[piece]
+
+    def diagnostics(self):
+        """Messages of the parser and then of Sema in the order and form the compiler prints them."""
+        res = []
+        for piece in self.pieces:
+            res.extend(piece.diags)
+        for piece in self.pieces:
+            res.extend(piece.checks)
+        return [err.text(*diag) for diag in res]
+
+    def num_errors(self):
+        return sum(kind == "error" for piece in self.pieces for (_, kind, _) in piece.diags + piece.checks)
@@ -0,0 +1,547 @@
+"""
+A control-flow graph of basic blocks in SSA form as middle end between the AST and the backends.
+
+Use lower to build a Func from a checked Prog.
+Func.run interprets it; Func.write emits it as IR, C or Python - depending on while_ast.EMIT - and so does str(func).
+"""
+
+import io
+import operator
+
+from tok import Tag
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, UnaryExpr, BoolExpr, LitExpr, SymExpr
+import trampoline
+import while_ast
+
+BIN_OPS = {
+    Tag.T_ADD: operator.add,
+    Tag.T_SUB: operator.sub,
+    Tag.T_MUL: operator.mul,
+    Tag.T_POW: operator.pow,
+    Tag.K_AND: operator.and_,
+    Tag.K_OR : operator.or_,
+    Tag.T_EQ : operator.eq,
+    Tag.T_NE : operator.ne,
+    Tag.T_LT : operator.lt,
+    Tag.T_LE : operator.le,
+    Tag.T_GT : operator.gt,
+    Tag.T_GE : operator.ge,
+}
+
+UNARY_OPS = {
+    Tag.K_NOT: operator.not_,
+    Tag.T_SUB: operator.neg,
+}
+
+# Values
+
+class Value:
+    __slots__ = ("id", "ty")
+
+    def __init__(self, ty):
+        self.id = None # assigned by Func.number
+        self.ty = ty
+
+class Const(Value):
+    __slots__ = ("val",)
+
+    def __init__(self, ty, val):
+        super().__init__(ty)
+        self.val = val
+
+class Insn(Value):
+    __slots__ = ("op", "args")
+
+    def __init__(self, ty, op, *args):
+        super().__init__(ty)
+        self.op   = op   # Tag of the operator; unary if there is only one arg
+        self.args = args
+
+class Phi(Value):
+    __slots__ = ("block", "args")
+
+    def __init__(self, ty, block):
+        super().__init__(ty)
+        self.block = block
+        self.args  = [] # one per predecessor of block
+
+# Terminators
+
+class Jump:
+    __slots__ = ("target",)
+
+    def __init__(self, target):
+        self.target = target
+
+class Branch:
+    __slots__ = ("cond", "then", "else_")
+
+    def __init__(self, cond, then, else_):
+        self.cond  = cond
+        self.then  = then
+        self.else_ = else_
+
+class Return:
+    __slots__ = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+
+def succs(term):
+    if isinstance(term, Jump):   return (term.target,)
+    if isinstance(term, Branch): return (term.then, term.else_)
+    return ()
+
+class Block:
+    __slots__ = ("id", "phis", "insns", "term", "preds")
+
+    def __init__(self, id): # pylint: disable=redefined-builtin
+        self.id    = id
+        self.phis  = []
+        self.insns = []
+        self.term  = None
+        self.preds = []
+
+    def __str__(self):
+        return f"bb{self.id}"
+
+# Func
+
+class Func:
+    def __init__(self, blocks, consts):
+        self.blocks     = blocks # blocks[0] is the entry
+        self.consts     = consts
+        self.num_values = 0
+        self.number()
+
+    def values(self):
+        for block in self.blocks:
+            yield from block.phis
+            yield from block.insns
+
+    def number(self):
+        num = 0
+        for val in self.values():
+            val.id = num
+            num += 1
+        for const in self.consts:
+            const.id = num
+            num += 1
+        self.num_values = num
+
+    def run(self):
+        vals = [None] * self.num_values
+        for const in self.consts:
+            vals[const.id] = const.val
+
+        (block, pred) = (self.blocks[0], None)
+        while True:
+            if block.phis:
+                i   = block.preds.index(pred)
+                new = [vals[phi.args[i].id] for phi in block.phis] # phis read their args simultaneously
+                for (phi, val) in zip(block.phis, new):
+                    vals[phi.id] = val
+
+            for insn in block.insns:
+                if len(insn.args) == 2:
+                    vals[insn.id] = BIN_OPS[insn.op](vals[insn.args[0].id], vals[insn.args[1].id])
+                else:
+                    vals[insn.id] = UNARY_OPS[insn.op](vals[insn.args[0].id])
+
+            term = block.term
+            pred = block
+            if isinstance(term, Jump):
+                block = term.target
+            elif isinstance(term, Branch):
+                block = term.then if vals[term.cond.id] else term.else_
+            else:
+                return vals[term.val.id]
+
+    # emit
+
+    def write(self, file):
+        """Emits self as while_ast.EMIT to file."""
+        if while_ast.EMIT is while_ast.Emit.C:
+            self.emit_c(while_ast.Writer(file))
+        elif while_ast.EMIT is while_ast.Emit.PY:
+            self.emit_py(while_ast.Writer(file, "    "))
+        else:
+            self.emit_ir(while_ast.Writer(file, "    "))
+
+    def __str__(self):
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
+
+    @staticmethod
+    def name(val):
+        if isinstance(val, Const):
+            if val.ty is Tag.K_BOOL:
+                if while_ast.EMIT is while_ast.Emit.PY: return "True" if val.val else "False"
+                return "true" if val.val else "false"
+            return f"{val.val}"
+        if while_ast.EMIT is while_ast.Emit.IR: return f"%{val.id}"
+        return f"v{val.id}"
+
+    @staticmethod
+    def op(insn):
+        if while_ast.EMIT is while_ast.Emit.C:
+            if insn.op is Tag.K_AND: return "&"
+            if insn.op is Tag.K_OR:  return "|"
+            if insn.op is Tag.K_NOT: return "!"
+        return f"{insn.op}"
+
+    def expr(self, insn):
+        if insn.op is Tag.T_POW and while_ast.EMIT is while_ast.Emit.C:
+            return f"while_pow({self.name(insn.args[0])}, {self.name(insn.args[1])})"
+        if len(insn.args) == 2:
+            return f"{self.name(insn.args[0])} {self.op(insn)} {self.name(insn.args[1])}"
+        return f"{self.op(insn)} {self.name(insn.args[0])}"
+
+    def copies(self, pred, block, out):
+        """Assigns the args of the phis in block coming from pred to their incoming variables."""
+        if block.phis:
+            i   = block.preds.index(pred)
+            end = ";\n" if while_ast.EMIT is while_ast.Emit.C else "\n"
+            for phi in block.phis:
+                out.indented(f"p{phi.id} = {self.name(phi.args[i])}{end}")
+
+    def emit_ir(self, out):
+        for block in self.blocks:
+            preds = ", ".join(f"{pred}" for pred in block.preds)
+            out.write(f"{block}:" + (f" ; preds: {preds}" if preds else "") + "\n")
+            out.indent()
+            for phi in block.phis:
+                args = ", ".join(f"[{self.name(arg)}, {pred}]" for (arg, pred) in zip(phi.args, block.preds))
+                out.indented(f"{self.name(phi)}: {phi.ty} = phi {args}\n")
+            for insn in block.insns:
+                out.indented(f"{self.name(insn)}: {insn.ty} = {self.expr(insn)}\n")
+
+            term = block.term
+            if isinstance(term, Jump):
+                out.indented(f"jmp {term.target}\n")
+            elif isinstance(term, Branch):
+                out.indented(f"br {self.name(term.cond)}, {term.then}, {term.else_}\n")
+            else:
+                out.indented(f"ret {self.name(term.val)}\n")
+            out.dedent()
+
+    def emit_c(self, out):
+        out.write("#include <stdbool.h>\n")
+        out.write("#include <stdio.h>\n")
+        out.write("\n")
+        if any(insn.op is Tag.T_POW for block in self.blocks for insn in block.insns):
+            out.write(while_ast.C_POW)
+        out.write("int main() {\n")
+        out.indent()
+
+        for val in self.values():
+            out.indented(f"{val.ty} {self.name(val)};\n")
+            if isinstance(val, Phi):
+                out.indented(f"{val.ty} p{val.id};\n")
+
+        for block in self.blocks:
+            if block.preds:
+                out.write(f"{block}:\n")
+            for phi in block.phis:
+                out.indented(f"{self.name(phi)} = p{phi.id};\n")
+            for insn in block.insns:
+                out.indented(f"{self.name(insn)} = {self.expr(insn)};\n")
+
+            term = block.term
+            for succ in succs(term):
+                self.copies(block, succ, out)
+            if isinstance(term, Jump):
+                out.indented(f"goto {term.target};\n")
+            elif isinstance(term, Branch):
+                out.indented(f"if ({self.name(term.cond)}) goto {term.then}; else goto {term.else_};\n")
+            elif term.val.ty is Tag.K_BOOL:
+                out.indented(f'printf({self.name(term.val)} ? "true\\n" : "false\\n");\n')
+                out.indented("return 0;\n")
+            else:
+                out.indented(f'printf("%i\\n", {self.name(term.val)});\n')
+                out.indented("return 0;\n")
+
+        out.dedent()
+        out.write("}\n")
+
+    def emit_py(self, out):
+        """
+        All blocks run in one loop in main, so all values are fast local variables.
+        The loop finds block bb through a balanced tree of comparisons instead of an elif chain,
+        whose nesting CPython cannot even compile for large programs and which takes a comparison per block.
+        """
+        out.write("def main():\n")
+        out.indent()
+        out.indented("bb = 0\n")
+        out.indented("while True:\n")
+        out.indent()
+        self.dispatch(0, len(self.blocks), out)
+        out.dedent()
+        out.dedent()
+        out.write("\n")
+        rets = [block.term.val.ty for block in self.blocks if isinstance(block.term, Return)]
+        out.write(while_ast.py_main(rets[0] if rets else Tag.K_INT, out.tab))
+
+    def dispatch(self, lo, hi, out):
+        """Emits the blocks lo to hi - 1 for the case that lo <= bb < hi."""
+        if hi - lo > 1:
+            mid = (lo + hi) // 2
+            out.indented(f"if bb < {mid}:\n")
+            out.indent()
+            self.dispatch(lo, mid, out)
+            out.dedent()
+            out.indented("else:\n")
+            out.indent()
+            self.dispatch(mid, hi, out)
+            out.dedent()
+            return
+
+        block = self.blocks[lo]
+        for phi in block.phis:
+            out.indented(f"{self.name(phi)} = p{phi.id}\n")
+        for insn in block.insns:
+            out.indented(f"{self.name(insn)} = {self.expr(insn)}\n")
+
+        term = block.term
+        for succ in succs(term):
+            self.copies(block, succ, out)
+        if isinstance(term, Jump):
+            out.indented(f"bb = {term.target.id}\n")
+        elif isinstance(term, Branch):
+            out.indented(f"bb = {term.then.id} if {self.name(term.cond)} else {term.else_.id}\n")
+        else:
+            out.indented(f"return {self.name(term.val)}\n")
+
+# lowering
+
+class Lower: # pylint: disable=too-many-instance-attributes
+    """
+    SSA construction after Braun et al.: "Simple and Efficient Construction of Static Single Assignment Form".
+    Variables are identified by their DeclStmt.
+    Instead of recursing, operands of new phis are looked up once the whole CFG is built;
+    trivial phis are removed afterwards.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.consts = {} # (type, value) -> Const
+        self.defs   = {} # DeclStmt -> Block -> Value
+        self.sealed = set()
+        self.todo   = [] # (Phi, DeclStmt) whose args are still missing
+        self.frames = [] # (assigned, declared) DeclStmts of the enclosing while/if statements
+        self.merges = {} # loop head or join Block -> DeclStmts assigned within its while/if statement
+        self.cur    = self.block()
+        self.sealed.add(self.cur)
+
+    def lower(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.stmt(prog.stmt))
+        self.cur.term = Return(trampoline.run(self.expr(prog.ret)))
+
+        while self.todo:
+            (phi, decl) = self.todo.pop()
+            preds = phi.block.preds
+            if phi.block in self.merges and decl not in self.merges[phi.block]:
+                # not assigned in the loop or the branches: all args are the value from before the statement
+                phi.args = [self.read(decl, preds[0])] * len(preds)
+            else:
+                phi.args = [self.read(decl, pred) for pred in preds]
+        self.remove_trivial_phis()
+        return Func(self.blocks, list(self.consts.values()))
+
+    # helpers
+
+    def block(self):
+        block = Block(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def jump(self, target):
+        self.cur.term = Jump(target)
+        target.preds.append(self.cur)
+
+    def branch(self, cond, then, else_):
+        self.cur.term = Branch(cond, then, else_)
+        then .preds.append(self.cur)
+        else_.preds.append(self.cur)
+
+    def const(self, ty, val):
+        key = (ty, val)
+        if key not in self.consts:
+            self.consts[key] = Const(ty, val)
+        return self.consts[key]
+
+    def insn(self, ty, op, *args):
+        insn = Insn(ty, op, *args)
+        self.cur.insns.append(insn)
+        return insn
+
+    # SSA construction
+
+    def write(self, decl, block, val):
+        self.defs.setdefault(decl, {})[block] = val
+
+    def read(self, decl, block):
+        defs = self.defs.setdefault(decl, {})
+        path = []
+        while block not in defs:
+            if block in self.sealed and len(block.preds) == 1:
+                path.append(block)
+                block = block.preds[0]
+            else:
+                phi = Phi(decl.ty, block)
+                block.phis.append(phi)
+                defs[block] = phi
+                self.todo.append((phi, decl))
+
+        val = defs[block]
+        for b in path: # remember the result along single-predecessor chains
+            defs[b] = val
+        return val
+
+    def enter(self):
+        self.frames.append((set(), set()))
+
+    def leave(self, merge):
+        (assigned, declared) = self.frames.pop()
+        self.merges[merge] = assigned
+        if self.frames: # variables declared within are out of scope outside
+            self.frames[-1][0].update(assigned - declared)
+
+    def remove_trivial_phis(self):
+        """A phi is trivial if it only merges itself and one other value; removing it may make its users trivial."""
+        subst = {}
+        users = {} # Phi -> Phis using it
+
+        def find(val):
+            root = val
+            while root in subst:
+                root = subst[root]
+            while val in subst: # path compression
+                (subst[val], val) = (root, subst[val])
+            return root
+
+        work = [phi for block in self.blocks for phi in block.phis]
+        for phi in work:
+            for arg in phi.args:
+                if isinstance(arg, Phi):
+                    users.setdefault(arg, set()).add(phi)
+
+        while work:
+            phi = work.pop()
+            if phi in subst:
+                continue
+            args = {find(arg) for arg in phi.args} - {phi}
+            if len(args) == 1:
+                same = args.pop()
+                subst[phi] = same
+                phi_users = users.pop(phi, set())
+                phi_users.discard(phi)
+                work.extend(phi_users)
+                if isinstance(same, Phi):
+                    users.setdefault(same, set()).update(phi_users)
+
+        for block in self.blocks:
+            block.phis = [phi for phi in block.phis if phi not in subst]
+        for block in self.blocks:
+            for phi in block.phis:
+                phi.args = [find(arg) for arg in phi.args]
+            for insn in block.insns:
+                insn.args = tuple(find(arg) for arg in insn.args)
+            if isinstance(block.term, Branch):
+                block.term.cond = find(block.term.cond)
+            elif isinstance(block.term, Return):
+                block.term.val = find(block.term.val)
+
+    # Stmt
+
+    def stmt(self, stmt):
+        if isinstance(stmt, StmtList):
+            for s in stmt.stmts:
+                yield self.stmt(s)
+        elif isinstance(stmt, DeclStmt):
+            self.write(stmt, self.cur, (yield self.expr(stmt.init)))
+            if self.frames: self.frames[-1][1].add(stmt)
+        elif isinstance(stmt, AssignStmt):
+            self.write(stmt.decl, self.cur, (yield self.expr(stmt.init)))
+            if self.frames: self.frames[-1][0].add(stmt.decl)
+        elif isinstance(stmt, WhileStmt):
+            yield self.while_stmt(stmt)
+        elif isinstance(stmt, IfStmt):
+            yield self.if_stmt(stmt)
+        elif isinstance(stmt, IfElseStmt):
+            yield self.if_else_stmt(stmt)
+        else:
+            assert False
+
+    def while_stmt(self, stmt):
+        self.enter()
+        head = self.block() # sealed once the back edge is known
+        self.jump(head)
+        self.cur = head
+        cond = yield self.expr(stmt.cond)
+
+        (body, done) = (self.block(), self.block())
+        self.branch(cond, body, done)
+        self.sealed.update((body, done))
+        self.cur = body
+        yield self.stmt(stmt.body)
+        self.jump(head)
+        self.sealed.add(head)
+        self.leave(head)
+        self.cur = done
+
+    def if_stmt(self, stmt):
+        self.enter()
+        cond = yield self.expr(stmt.cond)
+        (body, done) = (self.block(), self.block())
+        self.branch(cond, body, done)
+        self.sealed.add(body)
+        self.cur = body
+        yield self.stmt(stmt.body)
+        self.jump(done)
+        self.sealed.add(done)
+        self.leave(done)
+        self.cur = done
+
+    def if_else_stmt(self, stmt):
+        self.enter()
+        cond = yield self.expr(stmt.cond)
+        (body, alt_body, done) = (self.block(), self.block(), self.block())
+        self.branch(cond, body, alt_body)
+        self.sealed.update((body, alt_body))
+        self.cur = body
+        yield self.stmt(stmt.body)
+        self.jump(done)
+        self.cur = alt_body
+        yield self.stmt(stmt.alt_body)
+        self.jump(done)
+        self.sealed.add(done)
+        self.leave(done)
+        self.cur = done
+
+    # Expr
+
+    def expr(self, expr):
+        if isinstance(expr, LitExpr):
+            return self.const(Tag.K_INT, expr.val)
+        if isinstance(expr, BoolExpr):
+            return self.const(Tag.K_BOOL, expr.val)
+        if isinstance(expr, SymExpr):
+            return self.read(expr.decl, self.cur)
+        if isinstance(expr, UnaryExpr):
+            rhs = yield self.expr(expr.rhs)
+            if expr.op is Tag.T_ADD: return rhs
+            return self.insn(expr.ty, expr.op, rhs)
+        if isinstance(expr, BinExpr):
+            lhs = yield self.expr(expr.lhs)
+            rhs = yield self.expr(expr.rhs)
+            return self.insn(expr.ty, expr.op, lhs, rhs)
+        assert False
+
+def lower(prog):
+    return Lower().lower(prog)
@@ -2,19 +2,45 @@
 Lexes an input file and produces Tokens.
 """
 
-from copy import deepcopy
-import string
+import re
 
 from err import err
-from loc import Pos, Loc
+from loc import Loc, Source
 from tok import Tag, Tok
 
+# one alternative per token class; the first match wins
+TOKEN = re.compile(r"""
+    (?P<ws>   [ \t\n\r\x0b\x0c]+         )
+  | (?P<lit>  [0-9]+                    )
+  | (?P<sym>  [A-Za-z][A-Za-z0-9]*      )
+  | (?P<op>   [=!<>]=|[{}()+\-*;=<>]    )
+  | (?P<bang> ![\s\S]?                  ) # '!' without '='
+  | (?P<bad>  [\s\S]                    )
+""", re.VERBOSE)
+
+OPS = {
+    "{" : Tag.D_BRACE_L,
+    "}" : Tag.D_BRACE_R,
+    "(" : Tag.D_PAREN_L,
+    ")" : Tag.D_PAREN_R,
+    "+" : Tag.T_ADD,
+    "-" : Tag.T_SUB,
+    "*" : Tag.T_MUL,
+    ";" : Tag.T_SEMICOLON,
+    "=" : Tag.T_ASSIGN,
+    "==": Tag.T_EQ,
+    "!=": Tag.T_NE,
+    "<" : Tag.T_LT,
+    "<=": Tag.T_LE,
+    ">" : Tag.T_GT,
+    ">=": Tag.T_GE,
+}
+
 class Lexer:
     def __init__(self, file):
-        self.file = file
-        self.loc  = Loc(file.name, Pos(1, 1), Pos(1, 1))
-        self.peek = Pos(1, 1)
-        self.str  = ""
+        self.text = file.read() # the whole input is scanned at once
+        self.file = Source(file.name, self.text)
+        self.toks = None
         self.keywords = {
             "and"   : Tag.K_AND,
             "or"    : Tag.K_OR,
@@ -29,80 +55,31 @@ class Lexer:
             "else"  : Tag.K_ELSE,
         }
 
-    def accept_if(self, pred):
-        tell = self.file.tell()
-        char = self.file.read(1)
-
-        if pred(char):
-            self.str += char
-            self.loc.finis = deepcopy(self.peek)
-
-            if char == "": # end of file
-                pass
-            elif char == "\n":
-                self.peek.row += 1
-                self.peek.col = 1
-            else:
-                self.peek.col += 1
-            return True
-
-        self.file.seek(tell) # undo read
-        return False
-
-    def eat(self):
-        self.accept_if(lambda _ : True)
-
-    def accept(self, char):
-        return self.accept_if(lambda c : c == char)
-
-    def lex(self):
+    def tokens(self):
+        """Yields the Toks of the input lazily; M_EOF is repeated forever at the end."""
+        file     = self.file
+        keywords = self.keywords
+
+        for match in TOKEN.finditer(self.text):
+            kind = match.lastgroup
+
+            if kind == "op":
+                yield Tok(Loc(file, match.start(), match.end() - 1), OPS[match.group()])
+            elif kind == "sym":
+                sym = match.group()
+                yield Tok(Loc(file, match.start(), match.end() - 1), keywords.get(sym, sym))
+            elif kind == "lit":
+                yield Tok(Loc(file, match.start(), match.end() - 1), int(match.group()))
+            elif kind == "bang":
+                err(Loc(file, match.start(), match.start()), f"invalid input char '{match.group()}'; maybe you wanted to use '!='?")
+            elif kind == "bad":
+                err(Loc(file, match.start(), match.start()), f"invalid input char '{match.group()}'")
+
+        eof = len(self.text)
         while True:
-            self.loc.begin = deepcopy(self.peek)
-            self.loc.finis = deepcopy(self.peek)
-            self.str = ""
+            yield Tok(Loc(file, eof, eof), Tag.M_EOF)
 
-            if self.accept("" ): return Tok(self.loc, Tag.M_EOF)
-            if self.accept_if(lambda char : char in string.whitespace):
-                continue
-            if self.accept("{"): return Tok(self.loc, Tag.D_BRACE_L)
-            if self.accept("}"): return Tok(self.loc, Tag.D_BRACE_R)
-            if self.accept("("): return Tok(self.loc, Tag.D_PAREN_L)
-            if self.accept(")"): return Tok(self.loc, Tag.D_PAREN_R)
-            if self.accept("+"): return Tok(self.loc, Tag.T_ADD)
-            if self.accept("-"): return Tok(self.loc, Tag.T_SUB)
-            if self.accept("*"): return Tok(self.loc, Tag.T_MUL)
-            if self.accept(";"): return Tok(self.loc, Tag.T_SEMICOLON)
-
-            if self.accept("="):
-                if self.accept("="): return Tok(self.loc, Tag.T_EQ)
-                return Tok(self.loc, Tag.T_ASSIGN)
-
-            if self.accept("<"):
-                if self.accept("="): return Tok(self.loc, Tag.T_LE)
-                return Tok(self.loc, Tag.T_LT)
-
-            if self.accept(">"):
-                if self.accept("="): return Tok(self.loc, Tag.T_GE)
-                return Tok(self.loc, Tag.T_GT)
-
-            if self.accept("!"):
-                if self.accept("="): return Tok(self.loc, Tag.T_NE)
-                self.eat()
-                err(self.loc.anew_begin(), f"invalid input char '{self.str}'; maybe you wanted to use '!='?")
-                continue
-
-            # literal
-            if self.accept_if(lambda char : char in string.digits):
-                while self.accept_if(lambda char : char in string.digits):
-                    pass
-                return Tok(self.loc, int(self.str))
-
-            # identifier
-            if self.accept_if(lambda char : char in string.ascii_letters):
-                while self.accept_if(lambda char : char in string.ascii_letters or char in string.digits):
-                    pass
-                if self.str in self.keywords: return Tok(self.loc, self.keywords[self.str])
-                return Tok(self.loc, self.str)
-
-            self.eat()
-            err(self.loc.anew_begin(), f"invalid input char '{self.str}'")
+    def lex(self):
+        if self.toks is None:
+            self.toks = self.tokens()
+        return next(self.toks)
@@ -1,10 +1,39 @@
 """
 Helpers to keep track of source code locations.
+
+Locations are stored as plain offsets into the Source;
+rows and columns are only computed when a location is printed.
 """
 
-from copy import deepcopy
+from bisect import bisect_right
+from itertools import accumulate
+
+class Source:
+    __slots__ = ("name", "text", "starts")
+
+    def __init__(self, name, text):
+        self.name   = name
+        self.text   = text
+        self.starts = None # offset of each line; built on first use
+
+    def __str__(self):
+        return f"{self.name}"
+
+    def pos(self, offset):
+        if self.starts is None:
+            self.starts = [0, *accumulate(len(line) + 1 for line in self.text.split("\n")[:-1])]
+        row = bisect_right(self.starts, offset)
+        return Pos(row, offset - self.starts[row - 1] + 1)
+
+    def line(self, row):
+        self.pos(0)
+        begin = self.starts[row - 1]
+        finis = self.starts[row] - 1 if row < len(self.starts) else len(self.text)
+        return self.text[begin:finis]
 
 class Pos:
+    __slots__ = ("row", "col")
+
     def __init__(self, row, col):
         self.row = row
         self.col = col
@@ -19,23 +48,24 @@ class Pos:
         return not self == other
 
 class Loc:
+    __slots__ = ("file", "begin", "finis")
+
     def __init__(self, file, begin, finis):
-        self.file = file
-        self.begin = begin
-        self.finis = finis
+        self.file  = file  # Source
+        self.begin = begin # offset of first char
+        self.finis = finis # offset of last char
 
     def __str__(self):
-        if self.begin == self.finis:
-            return f"{self.file}:{self.begin}"
-        if self.begin.row == self.finis.row:
-            return f"{self.file}:{self.begin}-{self.finis.col}"
-        return f"{self.file}:{self.begin}-{self.finis}"
+        begin = self.file.pos(self.begin)
+        finis = self.file.pos(self.finis)
+        if begin == finis:
+            return f"{self.file}:{begin}"
+        if begin.row == finis.row:
+            return f"{self.file}:{begin}-{finis.col}"
+        return f"{self.file}:{begin}-{finis}"
 
     def anew_begin(self):
         return Loc(self.file, self.begin, self.begin)
 
     def anew_finis(self):
         return Loc(self.file, self.finis, self.finis)
-
-    def copy(self):
-        return Loc(self.file, deepcopy(self.begin), deepcopy(self.finis))
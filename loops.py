@@ -0,0 +1,245 @@
+"""
+Loop-invariant code motion and strength reduction of induction variables for WhileStmts.
+
+Both work on a checked Prog and introduce new variables right before a WhileStmt in its enclosing block.
+Their names contain an underscore, so they can never clash with - or be shadowed by - identifiers of the program.
+Run Prog.check again afterwards to assign slots to them.
+"""
+
+from tok import Tag, Tok
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, UnaryExpr, LitExpr, SymExpr
+import trampoline
+
+class Loops: # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.depth   = {} # DeclStmt -> number of enclosing WhileStmts
+        self.assigns = {} # WhileStmt -> DeclStmt declared outside of it -> number of assignments within
+        self.ivs     = {} # DeclStmt -> (WhileStmt, AssignStmt, step) of basic induction variables
+        self.loops   = [] # enclosing WhileStmts; loops[i] has depth i + 1
+        self.every   = () # enclosing WhileStmts whose every iteration evaluates the current expression
+        self.pending = [] # one list of DeclStmts per loop to insert before it
+        self.updates = {} # WhileStmt -> AssignStmt of an induction variable -> AssignStmts to insert after it
+        self.temps   = {} # (DeclStmt, factor) -> DeclStmt of i * factor
+        self.hoisted = {} # (WhileStmt, key) -> DeclStmt of the invariant expression with this key hoisted before the loop
+        self.num_vars    = 0
+        self.num_hoisted = 0
+        self.num_reduced = 0
+
+    def optimize(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.analyze(prog.stmt))
+        trampoline.run(self.stmt(prog.stmt, self.reduce_expr))
+        trampoline.run(self.stmt(prog.stmt, self.hoist_expr))
+
+    # helpers
+
+    def var(self, loc, prefix, init):
+        tok  = Tok(loc, f"{prefix}_{self.num_vars}")
+        decl = DeclStmt(loc, init.ty, tok, init)
+        self.num_vars += 1
+        return decl
+
+    @staticmethod
+    def sym(decl):
+        sym = SymExpr(decl.loc, decl.sym)
+        sym.decl = decl
+        sym.ty   = decl.ty
+        return sym
+
+    # analysis
+
+    def analyze(self, stmt):
+        if isinstance(stmt, StmtList):
+            for s in stmt.stmts:
+                yield self.analyze(s)
+        elif isinstance(stmt, DeclStmt):
+            self.depth[stmt] = len(self.loops)
+        elif isinstance(stmt, AssignStmt):
+            if self.loops:
+                counts = self.assigns[self.loops[-1]]
+                counts[stmt.decl] = counts.get(stmt.decl, 0) + 1
+        elif isinstance(stmt, WhileStmt):
+            self.loops.append(stmt)
+            self.assigns[stmt] = {}
+            yield self.analyze(stmt.body)
+            self.loops.pop()
+
+            counts = self.assigns[stmt]
+            if self.loops: # only variables declared outside of the enclosing loop are of interest there
+                outer = self.assigns[self.loops[-1]]
+                for (decl, num) in counts.items():
+                    if self.depth[decl] < len(self.loops):
+                        outer[decl] = outer.get(decl, 0) + num
+            for s in stmt.body.stmts:
+                if (step := self.step(s)) is not None and counts[s.decl] == 1 and self.depth[s.decl] <= len(self.loops):
+                    self.ivs[s.decl] = (stmt, s, step)
+        elif isinstance(stmt, (IfStmt, IfElseStmt)):
+            yield self.analyze(stmt.body)
+            if isinstance(stmt, IfElseStmt):
+                yield self.analyze(stmt.alt_body)
+        else:
+            assert False
+
+    @staticmethod
+    def step(stmt):
+        """Returns c if stmt is i = i + c, i = c + i or i = i - c for a literal c."""
+        if not isinstance(stmt, AssignStmt) or not isinstance(stmt.init, BinExpr):
+            return None
+        (l, op, r) = (stmt.init.lhs, stmt.init.op, stmt.init.rhs)
+        if op is Tag.T_ADD and isinstance(l, LitExpr):
+            (l, r) = (r, l)
+        if not isinstance(l, SymExpr) or l.decl is not stmt.decl or not isinstance(r, LitExpr):
+            return None
+        if op is Tag.T_ADD: return  r.val
+        if op is Tag.T_SUB: return -r.val
+        return None
+
+    def level(self, decl):
+        """Index of the outermost enclosing loop that neither declares nor assigns decl."""
+        (lo, hi) = (self.depth[decl], len(self.loops))
+        while lo < hi: # if an inner loop assigns decl, so do all loops around it
+            mid = (lo + hi) // 2
+            if decl in self.assigns[self.loops[mid]]:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # transformation
+    #
+    # stmt rewrites all expressions with expr, which returns the new expression and - for hoist_expr - its level;
+    # new variables are inserted before their loop and updates of induction variables after theirs.
+
+    def stmt(self, stmt, expr):
+        if isinstance(stmt, StmtList):
+            stmts = []
+            for s in stmt.stmts:
+                if isinstance(s, WhileStmt):
+                    self.loops.append(s)
+                    self.pending.append([])
+                    every = self.every
+                    self.every = (*every, s)
+                    s.cond = (yield expr(s.cond))[0]
+                    self.every = (s,)
+                    yield self.stmt(s.body, expr)
+                    self.every = every
+                    self.loops.pop()
+                    stmts.extend(self.pending.pop())
+                    if s in self.updates:
+                        updates = self.updates.pop(s)
+                        s.body.stmts = [u for t in s.body.stmts for u in (t, *updates.get(t, ()))]
+                else:
+                    yield self.stmt(s, expr)
+                stmts.append(s)
+            stmt.stmts = stmts
+        elif isinstance(stmt, (DeclStmt, AssignStmt)):
+            stmt.init = (yield expr(stmt.init))[0]
+        elif isinstance(stmt, (IfStmt, IfElseStmt)):
+            stmt.cond = (yield expr(stmt.cond))[0]
+            (every, self.every) = (self.every, ())
+            yield self.stmt(stmt.body, expr)
+            if isinstance(stmt, IfElseStmt):
+                yield self.stmt(stmt.alt_body, expr)
+            self.every = every
+        else:
+            assert False
+
+    def reduce_expr(self, expr):
+        """
+        Replaces i * c by a new variable that is incremented along with the induction variable i.
+        The update costs as much as the multiplication, so a new variable is only introduced for an i * c
+        evaluated on every iteration of the loop of i; once there is one, all i * c within that loop use it.
+        """
+        if isinstance(expr, BinExpr):
+            (expr.lhs, _) = yield self.reduce_expr(expr.lhs)
+            (expr.rhs, _) = yield self.reduce_expr(expr.rhs)
+            (l, r) = (expr.lhs, expr.rhs)
+            if expr.op is Tag.T_MUL and isinstance(l, LitExpr):
+                (l, r) = (r, l)
+            if expr.op is Tag.T_MUL and isinstance(l, SymExpr) and isinstance(r, LitExpr) and l.decl in self.ivs:
+                loop = self.ivs[l.decl][0] # i * c is only kept up to date within it
+                if loop in self.every or (loop in self.loops and (l.decl, r.val) in self.temps):
+                    return (self.reduce(expr, l.decl, r.val), None)
+        elif isinstance(expr, UnaryExpr):
+            (expr.rhs, _) = yield self.reduce_expr(expr.rhs)
+        return (expr, None)
+
+    def reduce(self, expr, iv, factor):
+        key = (iv, factor)
+        if key not in self.temps:
+            (loop, update, step) = self.ivs[iv]
+            i    = self.loops.index(loop)
+            decl = self.var(expr.loc, "t_iv", expr)
+            self.pending[i].append(decl)
+            self.depth[decl] = i
+            self.assigns[loop][decl] = 1
+
+            inc    = step * factor
+            lit    = LitExpr(update.loc, abs(inc))
+            lit.ty = Tag.K_INT
+            add    = BinExpr(update.loc, self.sym(decl), Tag.T_ADD if inc >= 0 else Tag.T_SUB, lit)
+            add.ty = Tag.K_INT
+            assign = AssignStmt(update.loc, decl.sym, add)
+            assign.decl = decl
+            self.updates.setdefault(loop, {}).setdefault(update, []).append(assign)
+            self.temps[key] = decl
+            self.num_reduced += 1
+        return self.sym(self.temps[key])
+
+    def hoist_expr(self, expr):
+        """Moves expr in front of the outermost loop that does not change it."""
+        (expr, level) = yield self.invariant(expr)
+        if level < len(self.loops):
+            expr = yield self.hoist(expr, level)
+        return (expr, level)
+
+    def invariant(self, expr):
+        """
+        Returns expr and the index of the outermost loop it is invariant in - len(self.loops) if it is not.
+        Invariant operands of an expression that is not are hoisted.
+        """
+        if isinstance(expr, SymExpr):
+            return (expr, self.level(expr.decl))
+        if isinstance(expr, UnaryExpr):
+            (expr.rhs, level) = yield self.invariant(expr.rhs)
+            return (expr, level)
+        if isinstance(expr, BinExpr):
+            (expr.lhs, l_level) = yield self.invariant(expr.lhs)
+            (expr.rhs, r_level) = yield self.invariant(expr.rhs)
+            if l_level < r_level: expr.lhs = yield self.hoist(expr.lhs, l_level)
+            if r_level < l_level: expr.rhs = yield self.hoist(expr.rhs, r_level)
+            return (expr, max(l_level, r_level))
+        return (expr, 0)
+
+    def hoist(self, expr, level):
+        """Returns a variable holding expr, which is declared before loops[level] unless an equal expression already is."""
+        if not isinstance(expr, (BinExpr, UnaryExpr)):
+            return expr
+        key = (self.loops[level], (yield self.key(expr)))
+        if key not in self.hoisted:
+            decl = self.var(expr.loc, "t_inv", expr)
+            self.pending[level].append(decl)
+            self.depth[decl] = level
+            self.hoisted[key] = decl
+        self.num_hoisted += 1
+        return self.sym(self.hoisted[key])
+
+    def key(self, expr):
+        """Equal for expressions with the same operators and operands, which have the same value where they are invariant."""
+        if isinstance(expr, BinExpr):
+            return (expr.op, (yield self.key(expr.lhs)), (yield self.key(expr.rhs)))
+        if isinstance(expr, UnaryExpr):
+            return (expr.op, (yield self.key(expr.rhs)))
+        if isinstance(expr, SymExpr):
+            return (SymExpr, expr.decl)
+        return (type(expr), expr.val)
+
+def optimize(prog):
+    """Optimizes the loops of prog in place and returns the Loops with its statistics."""
+    loops = Loops()
+    loops.optimize(prog)
+    prog.check() # assign slots to the new variables
+    return loops
@@ -0,0 +1,48 @@
+"""
+Compiles the C output of a program with the local C compiler and runs the resulting executable.
+
+Executables are kept in the cache under the SHA-256 of the C source, the compiler and its flags;
+running the same program again skips the compiler entirely.
+"""
+
+import os
+import subprocess
+import tempfile
+
+import cache
+
+class Error(Exception):
+    pass
+
+def build(src, cc = "cc", level = "2"):
+    """Returns the path of an executable built from the C source src - compiling it only if it is not cached yet."""
+    cmd  = [cc, f"-O{level}"]
+    path = cache.path(cache.key(*cmd, src), "exe")
+    if cache.touch(path):
+        return path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        c_file = os.path.join(tmp, "prog.c")
+        exe    = os.path.join(tmp, "prog")
+        with open(c_file, "w", encoding="ASCII") as out_file:
+            out_file.write(src)
+        try:
+            res = subprocess.run([*cmd, "-o", exe, c_file], capture_output=True, text=True, check=False)
+        except OSError as error:
+            raise Error(f"cannot run C compiler '{cc}': {error.strerror}") from error
+        if res.returncode != 0:
+            raise Error(f"C compiler '{cc}' failed:\n{res.stderr}")
+        with open(exe, "rb") as in_file:
+            data = in_file.read()
+    cache.store(path, lambda out_file: out_file.write(data), 0o755)
+    return path
+
+def run(src, cc = "cc", level = "2"):
+    """Builds and runs src; returns the result of the program as eval would, i.e. as int or bool."""
+    res = subprocess.run([build(src, cc, level)], capture_output=True, text=True, check=False)
+    if res.returncode != 0:
+        raise Error(f"executable failed with exit code {res.returncode}")
+    out = res.stdout.strip()
+    if out in ("true", "false"):
+        return out == "true"
+    return int(out)
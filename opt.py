@@ -0,0 +1,187 @@
+"""
+Constant folding and algebraic simplification of a checked Prog.
+
+The pass rewrites the tree in place before any backend runs,
+so the interpreters as well as the C, Python and bytecode output benefit from it.
+"""
+
+from tok import Tag
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, UnaryExpr, BoolExpr, LitExpr
+import trampoline
+
+# folded ints must still be valid literals in C
+INT_MAX = 2**31 - 1
+
+def kids(node):
+    if isinstance(node, Prog):       return (node.stmt, node.ret)
+    if isinstance(node, StmtList):   return node.stmts
+    if isinstance(node, DeclStmt):   return (node.init,)
+    if isinstance(node, AssignStmt): return (node.init,)
+    if isinstance(node, WhileStmt):  return (node.cond, node.body)
+    if isinstance(node, IfStmt):     return (node.cond, node.body)
+    if isinstance(node, IfElseStmt): return (node.cond, node.body, node.alt_body)
+    if isinstance(node, BinExpr):    return (node.lhs, node.rhs)
+    if isinstance(node, UnaryExpr):  return (node.rhs,)
+    return ()
+
+def size(node):
+    """Number of nodes in the tree below and including node."""
+    res   = 0
+    stack = [node]
+    while stack:
+        res += 1
+        stack.extend(kids(stack.pop()))
+    return res
+
+def is_const(expr):
+    return isinstance(expr, (LitExpr, BoolExpr))
+
+def is_int(expr, val):
+    return isinstance(expr, LitExpr) and expr.val == val
+
+def is_bool(expr, val):
+    return isinstance(expr, BoolExpr) and expr.val is val
+
+class Folder:
+    def __init__(self):
+        self.num_folded = 0 # expressions replaced by a constant or an operand
+        self.num_pruned = 0 # statements removed or inlined
+
+    def prog(self, prog):
+        assert isinstance(prog, Prog)
+        prog.stmt = trampoline.run(self.stmt(prog.stmt))
+        prog.ret  = trampoline.run(self.expr(prog.ret))
+
+    # Stmt
+    #
+    # stmt returns the simplified statement, a StmtList to be inlined into the enclosing one, or None if it is gone.
+
+    def stmt(self, stmt):
+        if isinstance(stmt, StmtList):
+            stmts = []
+            for s in stmt.stmts:
+                s = yield self.stmt(s)
+                if isinstance(s, StmtList):
+                    stmts.extend(s.stmts)
+                elif s is not None:
+                    stmts.append(s)
+            stmt.stmts = stmts
+            return stmt
+        if isinstance(stmt, (DeclStmt, AssignStmt)):
+            stmt.init = yield self.expr(stmt.init)
+            return stmt
+        if isinstance(stmt, WhileStmt):
+            stmt.cond = yield self.expr(stmt.cond)
+            if is_bool(stmt.cond, False):
+                self.num_pruned += 1
+                return None
+            stmt.body = yield self.stmt(stmt.body)
+            return stmt
+        if isinstance(stmt, IfStmt):
+            stmt.cond = yield self.expr(stmt.cond)
+            stmt.body = yield self.stmt(stmt.body)
+            if is_bool(stmt.cond, False) or not stmt.body.stmts:
+                self.num_pruned += 1
+                return None
+            if is_bool(stmt.cond, True):
+                return self.inline(stmt, stmt.body)
+            return stmt
+        if isinstance(stmt, IfElseStmt):
+            stmt.cond     = yield self.expr(stmt.cond)
+            stmt.body     = yield self.stmt(stmt.body)
+            stmt.alt_body = yield self.stmt(stmt.alt_body)
+            if is_const(stmt.cond):
+                return self.inline(stmt, stmt.body if stmt.cond.val else stmt.alt_body)
+            if not stmt.body.stmts and not stmt.alt_body.stmts:
+                self.num_pruned += 1
+                return None
+            return stmt
+        assert False
+
+    def inline(self, stmt, body):
+        """Replaces stmt by body - unless body declares variables that would then leak into the enclosing scope."""
+        if any(isinstance(s, DeclStmt) for s in body.stmts):
+            if isinstance(stmt, IfStmt): return stmt
+            cond = BoolExpr(stmt.cond.loc, True)
+            cond.ty = Tag.K_BOOL
+            return IfStmt(stmt.loc, cond, body)
+        self.num_pruned += 1
+        return body
+
+    # Expr
+
+    def expr(self, expr):
+        if isinstance(expr, BinExpr):
+            expr.lhs = yield self.expr(expr.lhs)
+            expr.rhs = yield self.expr(expr.rhs)
+            res = self.bin_expr(expr)
+        elif isinstance(expr, UnaryExpr):
+            expr.rhs = yield self.expr(expr.rhs)
+            res = self.unary_expr(expr)
+        else:
+            return expr
+
+        if res is not expr:
+            self.num_folded += 1
+        return res
+
+    @staticmethod
+    def const(expr):
+        """Evaluates expr whose operands are constants and returns the result as a new constant."""
+        val = trampoline.run(expr.eval(None))
+        if isinstance(val, bool):
+            res = BoolExpr(expr.loc, val)
+        elif -INT_MAX <= val <= INT_MAX:
+            res = LitExpr(expr.loc, val)
+        else:
+            return expr
+        res.ty = expr.ty
+        return res
+
+    def bin_expr(self, expr):
+        (l, op, r) = (expr.lhs, expr.op, expr.rhs)
+
+        if is_const(l) and is_const(r) and op is not Tag.T_POW: # the power might be huge
+            return self.const(expr)
+
+        if op is Tag.T_ADD:
+            if is_int(r, 0): return l
+            if is_int(l, 0): return r
+        elif op is Tag.T_SUB:
+            if is_int(r, 0): return l
+        elif op is Tag.T_MUL:
+            if is_int(r, 1): return l
+            if is_int(l, 1): return r
+            if is_int(r, 0): return r
+            if is_int(l, 0): return l
+        elif op is Tag.K_AND:
+            if is_bool(r, True ): return l
+            if is_bool(l, True ): return r
+            if is_bool(r, False): return r
+            if is_bool(l, False): return l
+        elif op is Tag.K_OR:
+            if is_bool(r, False): return l
+            if is_bool(l, False): return r
+            if is_bool(r, True ): return r
+            if is_bool(l, True ): return l
+        return expr
+
+    def unary_expr(self, expr):
+        (op, r) = (expr.op, expr.rhs)
+
+        if op is Tag.T_ADD:
+            return r
+        if is_const(r):
+            return self.const(expr)
+        if isinstance(r, UnaryExpr) and r.op is op:
+            return r.rhs # not not b, - - x
+        return expr
+
+def fold(prog):
+    """Simplifies prog in place and returns the Folder with its statistics."""
+    folder = Folder()
+    folder.prog(prog)
+    return folder
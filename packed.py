@@ -0,0 +1,242 @@
+"""
+A compact struct-of-arrays form of the While AST.
+
+All nodes of a Prog are stored in parallel arrays; children are referred to by index.
+Use pack to build it from a Prog and Packed.unpack to get the object tree back
+for checking, evaluation or emission.
+"""
+
+from array import array
+from enum import IntEnum, auto
+import struct
+import sys
+
+from tok import Tag, Tok
+from loc import Loc
+import trampoline
+from while_ast import Prog,                                 \
+    DeclStmt, AssignStmt, StmtList, WhileStmt,              \
+    IfStmt, IfElseStmt,                                     \
+    BinExpr, UnaryExpr, BoolExpr, LitExpr, SymExpr, ErrExpr
+
+class Kind(IntEnum):
+    PROG         = auto()
+    DECL_STMT    = auto()
+    ASSIGN_STMT  = auto()
+    STMT_LIST    = auto()
+    WHILE_STMT   = auto()
+    IF_STMT      = auto()
+    IF_ELSE_STMT = auto()
+    BIN_EXPR     = auto()
+    UNARY_EXPR   = auto()
+    BOOL_EXPR    = auto()
+    SYM_EXPR     = auto()
+    LIT_EXPR     = auto()
+    ERR_EXPR     = auto()
+
+TAGS = {tag.value: tag for tag in Tag}
+
+MAGIC   = b"WHPK"
+VERSION = 1
+
+class Packed: # pylint: disable=too-many-instance-attributes
+    """
+    Per node:
+        kind            Kind
+        op              Tag of BinExpr/UnaryExpr, type of DeclStmt
+        a, b, c, d      children, indices into names/lits/lists, or offsets - see pack
+        begin, finis    offsets of Loc
+
+    All indices and offsets are 32 bit wide.
+    """
+
+    def __init__(self, file):
+        self.file  = file
+        self.kind  = array("B")
+        self.op    = array("B")
+        self.a     = array("i")
+        self.b     = array("i")
+        self.c     = array("i")
+        self.d     = array("i")
+        self.begin = array("i")
+        self.finis = array("i")
+        self.lists = array("i") # children of StmtLists
+        self.names = []         # interned identifiers
+        self.lits  = []         # literals of LitExprs
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add(self, kind, loc, op = 0, kids = ()):
+        (a, b, c, d) = (*kids, -1, -1, -1, -1)[:4]
+        self.kind .append(kind)
+        self.op   .append(op)
+        self.a    .append(a)
+        self.b    .append(b)
+        self.c    .append(c)
+        self.d    .append(d)
+        self.begin.append(loc.begin)
+        self.finis.append(-1 if loc.finis is None else loc.finis) # None: empty StmtList at the very beginning
+        return len(self.kind) - 1
+
+    def sizeof(self):
+        """Approximate number of bytes needed, not counting the source."""
+        return sum(arr.itemsize * len(arr) for arr in self.arrays()) \
+            + sum(len(name) + 49 for name in self.names) + 28 * len(self.lits)
+
+    # serialization - the source itself is not saved
+
+    def arrays(self):
+        return (self.kind, self.op, self.a, self.b, self.c, self.d, self.begin, self.finis, self.lists)
+
+    def save(self, file):
+        file.write(MAGIC)
+        file.write(struct.pack("<HIIII", VERSION, len(self), len(self.lists), len(self.names), len(self.lits)))
+        for arr in self.arrays():
+            arr = array(arr.typecode, arr)
+            if sys.byteorder == "big":
+                arr.byteswap()
+            file.write(arr.tobytes())
+        for name in self.names:
+            data = name.encode("ASCII")
+            file.write(struct.pack("<I", len(data)))
+            file.write(data)
+        for lit in self.lits:
+            data = lit.to_bytes((lit.bit_length() + 8) // 8, "little", signed=True)
+            file.write(struct.pack("<I", len(data)))
+            file.write(data)
+
+    @staticmethod
+    def load(file, source):
+        """Loads a Packed saved from a Prog of source."""
+        def read(fmt):
+            return struct.unpack(fmt, file.read(struct.calcsize(fmt)))
+
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a packed While program")
+        (version, num_nodes, num_lists, num_names, num_lits) = read("<HIIII")
+        if version != VERSION:
+            raise ValueError(f"unsupported packed version {version}")
+
+        packed = Packed(source)
+        for arr in packed.arrays():
+            arr.frombytes(file.read((num_lists if arr is packed.lists else num_nodes) * arr.itemsize))
+            if sys.byteorder == "big":
+                arr.byteswap()
+        for _ in range(num_names):
+            packed.names.append(file.read(read("<I")[0]).decode("ASCII"))
+        for _ in range(num_lits):
+            packed.lits.append(int.from_bytes(file.read(read("<I")[0]), "little", signed=True))
+        return packed
+
+    def unpack(self):
+        return trampoline.run(self.node(len(self) - 1))
+
+    def loc(self, i):
+        return Loc(self.file, self.begin[i], None if self.finis[i] == -1 else self.finis[i])
+
+    def tok(self, name, begin):
+        return Tok(Loc(self.file, begin, begin + len(self.names[name]) - 1), self.names[name])
+
+    def node(self, i):
+        kind = self.kind[i]
+        (a, b, c, d) = (self.a[i], self.b[i], self.c[i], self.d[i])
+        loc  = self.loc(i)
+
+        if kind == Kind.PROG:
+            return Prog(loc, (yield self.node(a)), (yield self.node(b)))
+        if kind == Kind.DECL_STMT:
+            decl = DeclStmt(loc, TAGS[self.op[i]], self.tok(a, c), (yield self.node(b)))
+            decl.counter = d # keep names of Python output stable
+            return decl
+        if kind == Kind.ASSIGN_STMT:
+            return AssignStmt(loc, self.tok(a, c), (yield self.node(b)))
+        if kind == Kind.STMT_LIST:
+            stmts = []
+            for j in range(a, a + b):
+                stmts.append((yield self.node(self.lists[j])))
+            return StmtList(loc, stmts)
+        if kind == Kind.WHILE_STMT:
+            return WhileStmt(loc, (yield self.node(a)), (yield self.node(b)))
+        if kind == Kind.IF_STMT:
+            return IfStmt(loc, (yield self.node(a)), (yield self.node(b)))
+        if kind == Kind.IF_ELSE_STMT:
+            return IfElseStmt(loc, (yield self.node(a)), (yield self.node(b)), (yield self.node(c)))
+        if kind == Kind.BIN_EXPR:
+            return BinExpr(loc, (yield self.node(a)), TAGS[self.op[i]], (yield self.node(b)))
+        if kind == Kind.UNARY_EXPR:
+            return UnaryExpr(loc, TAGS[self.op[i]], (yield self.node(a)))
+        if kind == Kind.BOOL_EXPR:
+            return BoolExpr(loc, bool(a))
+        if kind == Kind.SYM_EXPR:
+            return SymExpr(loc, self.tok(a, self.begin[i]))
+        if kind == Kind.LIT_EXPR:
+            return LitExpr(loc, self.lits[a])
+        if kind == Kind.ERR_EXPR:
+            return ErrExpr(loc)
+        assert False
+
+class Packer:
+    def __init__(self, packed):
+        self.packed = packed
+        self.names  = {}
+
+    def name(self, tok):
+        if tok.sym not in self.names:
+            self.names[tok.sym] = len(self.packed.names)
+            self.packed.names.append(tok.sym)
+        return self.names[tok.sym]
+
+    @staticmethod
+    def op(tag):
+        return tag.value
+
+    def pack(self, node):
+        p = self.packed
+
+        if isinstance(node, Prog):
+            stmt = yield self.pack(node.stmt)
+            return p.add(Kind.PROG, node.loc, 0, (stmt, (yield self.pack(node.ret))))
+        if isinstance(node, DeclStmt):
+            init = yield self.pack(node.init)
+            return p.add(Kind.DECL_STMT, node.loc, self.op(node.ty), (self.name(node.sym), init, node.sym.loc.begin, node.counter))
+        if isinstance(node, AssignStmt):
+            init = yield self.pack(node.init)
+            return p.add(Kind.ASSIGN_STMT, node.loc, 0, (self.name(node.sym), init, node.sym.loc.begin))
+        if isinstance(node, StmtList):
+            stmts = []
+            for stmt in node.stmts:
+                stmts.append((yield self.pack(stmt)))
+            start = len(p.lists)
+            p.lists.extend(stmts)
+            return p.add(Kind.STMT_LIST, node.loc, 0, (start, len(stmts)))
+        if isinstance(node, WhileStmt):
+            cond = yield self.pack(node.cond)
+            return p.add(Kind.WHILE_STMT, node.loc, 0, (cond, (yield self.pack(node.body))))
+        if isinstance(node, IfStmt):
+            cond = yield self.pack(node.cond)
+            return p.add(Kind.IF_STMT, node.loc, 0, (cond, (yield self.pack(node.body))))
+        if isinstance(node, IfElseStmt):
+            cond = yield self.pack(node.cond)
+            body = yield self.pack(node.body)
+            return p.add(Kind.IF_ELSE_STMT, node.loc, 0, (cond, body, (yield self.pack(node.alt_body))))
+        if isinstance(node, BinExpr):
+            lhs = yield self.pack(node.lhs)
+            return p.add(Kind.BIN_EXPR, node.loc, self.op(node.op), (lhs, (yield self.pack(node.rhs))))
+        if isinstance(node, UnaryExpr):
+            return p.add(Kind.UNARY_EXPR, node.loc, self.op(node.op), ((yield self.pack(node.rhs)),))
+        if isinstance(node, BoolExpr):
+            return p.add(Kind.BOOL_EXPR, node.loc, 0, (int(node.val),))
+        if isinstance(node, SymExpr):
+            return p.add(Kind.SYM_EXPR, node.loc, 0, (self.name(node.sym),))
+        if isinstance(node, LitExpr):
+            p.lits.append(node.val)
+            return p.add(Kind.LIT_EXPR, node.loc, 0, (len(p.lits) - 1,))
+        if isinstance(node, ErrExpr):
+            return p.add(Kind.ERR_EXPR, node.loc)
+        assert False
+
+def pack(prog):
+    packed = Packed(prog.loc.file)
+    trampoline.run(Packer(packed).pack(prog))
+    return packed
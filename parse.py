@@ -12,6 +12,7 @@ from lexer import Lexer
 from tok import Tag, Tok
 from loc import Loc
 from err import err
+import trampoline
 
 class Prec(IntEnum):
     BOT   = auto()
@@ -26,7 +27,8 @@ class Prec(IntEnum):
 class Parser:
     def __init__(self, file):
         self.lexer = Lexer(file)
-        self.ahead = self.lexer.lex()
+        self.toks  = self.lexer.tokens()
+        self.ahead = next(self.toks)
         self.prev  = None
 
         self.prec = {
@@ -61,7 +63,7 @@ class Parser:
     def lex(self):
         result     = self.ahead
         self.prev  = result.loc.begin
-        self.ahead = self.lexer.lex()
+        self.ahead = next(self.toks)
         return result
 
     def accept(self, tag):
@@ -83,15 +85,25 @@ class Parser:
         return None
 
     # entry
+    #
+    # All other parse_* methods are generators that yield nested parse_* calls instead of recursing;
+    # parse_prog drives them with trampoline.run so deeply nested input does not hit the recursion limit.
 
     def parse_prog(self):
+        return trampoline.run(self.parse_prog_gen())
+
+    def parse_prog_gen(self):
         t    = self.track()
-        stmt = self.parse_stmt()
+        stmt = yield self.parse_stmt()
+        ret  = yield self.parse_ret()
+        return Prog(t.loc(), stmt, ret)
+
+    def parse_ret(self):
         self.expect(Tag.K_RETURN, "program")
-        ret  = self.parse_expr("return expression")
+        ret = yield self.parse_expr("return expression")
         self.expect(Tag.T_SEMICOLON, "at the end of the final return of the program")
         self.expect(Tag.M_EOF, "at the end of the program")
-        return Prog(t.loc(), stmt, ret)
+        return ret
 
     def parse_sym(self, ctxt=None):
         if (tok := self.accept(Tag.M_SYM)) is not None: return tok
@@ -106,28 +118,31 @@ class Parser:
         t     = self.track()
         stmts = []
 
-        while True:
-            while self.accept(Tag.T_SEMICOLON):
-                pass
-
-            if self.ahead.isa(Tag.K_INT) or self.ahead.isa(Tag.K_BOOL):
-                stmts.append(self.parse_decl_stmt())
-            elif self.ahead.isa(Tag.M_SYM):
-                stmts.append(self.parse_assign_stmt())
-            elif self.ahead.isa(Tag.K_WHILE):
-                stmts.append(self.parse_while_stmt())
-            elif self.ahead.isa(Tag.K_IF):
-                stmts.append(self.parse_if_else_stmt())
-            else:
-                break
+        while (stmt := (yield self.parse_next_stmt())) is not None:
+            stmts.append(stmt)
 
         return StmtList(t.loc(), stmts)
 
+    def parse_next_stmt(self):
+        """Skips empty statements and parses the next statement; None if none follows."""
+        while self.accept(Tag.T_SEMICOLON):
+            pass
+
+        if self.ahead.isa(Tag.K_INT) or self.ahead.isa(Tag.K_BOOL):
+            return (yield self.parse_decl_stmt())
+        if self.ahead.isa(Tag.M_SYM):
+            return (yield self.parse_assign_stmt())
+        if self.ahead.isa(Tag.K_WHILE):
+            return (yield self.parse_while_stmt())
+        if self.ahead.isa(Tag.K_IF):
+            return (yield self.parse_if_else_stmt())
+        return None
+
     def parse_assign_stmt(self):
         t    = self.track()
         sym  = self.eat(Tag.M_SYM)
         self.expect(Tag.T_ASSIGN, "assignment statement")
-        expr = self.parse_expr("right-hand side of an assignment statement")
+        expr = yield self.parse_expr("right-hand side of an assignment statement")
         self.expect(Tag.T_SEMICOLON, "end of an assignment statement")
         return AssignStmt(t.loc(), sym, expr)
 
@@ -136,32 +151,32 @@ class Parser:
         ty   = self.lex().tag
         sym  = self.parse_sym("identifier of a declaration statement")
         self.expect(Tag.T_ASSIGN, "declaration statement")
-        expr = self.parse_expr("right-hand side of a declaration statement")
+        expr = yield self.parse_expr("right-hand side of a declaration statement")
         self.expect(Tag.T_SEMICOLON, "end of a declaration statement")
         return DeclStmt(t.loc(), ty, sym, expr)
 
     def parse_while_stmt(self):
         t    = self.track()
         self.eat(Tag.K_WHILE)
-        cond = self.parse_expr("condition of a while statement")
+        cond = yield self.parse_expr("condition of a while statement")
         self.expect(Tag.D_BRACE_L, "while statement")
-        body = self.parse_stmt()
+        body = yield self.parse_stmt()
         self.expect(Tag.D_BRACE_R, "while statement")
         return WhileStmt(t.loc(), cond, body)
 
     def parse_if_else_stmt(self):
         t    = self.track()
         self.eat(Tag.K_IF)
-        cond = self.parse_expr("condition of an if statement")
+        cond = yield self.parse_expr("condition of an if statement")
         self.expect(Tag.D_BRACE_L, "if statement")
-        body = self.parse_stmt()
+        body = yield self.parse_stmt()
         self.expect(Tag.D_BRACE_R, "if statement")
         if not self.ahead.isa(Tag.K_ELSE):
             return IfStmt(t.loc(), cond, body)
         else:
             self.eat(Tag.K_ELSE)
             self.expect(Tag.D_BRACE_L, "else statement")
-            alt_body = self.parse_stmt()
+            alt_body = yield self.parse_stmt()
             self.expect(Tag.D_BRACE_R, "else statement")
             return IfElseStmt(t.loc(), cond, body, alt_body)
 
@@ -169,14 +184,14 @@ class Parser:
 
     def parse_expr(self, ctxt = None, cur_prec = Prec.BOT):
         t   = self.track()
-        lhs = self.parse_primary_or_unary_expr(ctxt)
+        lhs = yield self.parse_primary_or_unary_expr(ctxt)
 
         while self.ahead.is_bin_op():
             (l_prec, r_prec) = self.prec[self.ahead.tag]
             if l_prec < cur_prec:
                 break
             op  = self.lex().tag
-            rhs = self.parse_expr("right-hand side of operator '{op}'", r_prec)
+            rhs = yield self.parse_expr("right-hand side of operator '{op}'", r_prec)
             lhs = BinExpr(t.loc(), lhs, op, rhs)
 
         return lhs
@@ -191,11 +206,11 @@ class Parser:
 
         if self.ahead.tag.is_unary():
             op  = self.lex().tag
-            rhs = self.parse_expr("unary expression", Prec.NOT if op is Tag.K_NOT else Prec.UNARY)
+            rhs = yield self.parse_expr("unary expression", Prec.NOT if op is Tag.K_NOT else Prec.UNARY)
             return UnaryExpr(t.loc(), op, rhs)
 
         if self.accept(Tag.D_PAREN_L):
-            expr = self.parse_expr()
+            expr = yield self.parse_expr("parenthesized expression")
             self.expect(Tag.D_PAREN_R, "parenthesized expression")
             return expr
 
@@ -0,0 +1,137 @@
+"""
+Profiles the evaluation of a Prog by the 'tree' or the 'closure' engine.
+
+Only while a Profiler runs, the eval resp. closure method of each Stmt class is wrapped so that
+every execution of a statement is counted and timed; evaluation without a Profiler is not slowed down at all.
+The time of a statement includes its expressions; its own time excludes the statements nested within it.
+"""
+
+import contextlib
+from time import perf_counter_ns
+
+from while_ast import DeclStmt, AssignStmt, StmtList, WhileStmt, IfStmt, IfElseStmt
+import opt
+
+STMTS = (DeclStmt, AssignStmt, StmtList, WhileStmt, IfStmt, IfElseStmt)
+KINDS = {DeclStmt: "decl", AssignStmt: "assign", WhileStmt: "while", IfStmt: "if", IfElseStmt: "if-else"}
+TOP   = 30 # statements listed by Profiler.report
+
+class Stats:
+    __slots__ = ("count", "total", "own")
+
+    def __init__(self):
+        self.count = 0 # executions
+        self.total = 0 # ns, including nested statements
+        self.own   = 0 # ns, excluding nested statements
+
+class Profiler:
+    def __init__(self, prog):
+        self.prog    = prog
+        self.stats   = {}       # Stmt -> Stats, in program order
+        self.parents = {}       # Stmt -> the Stmt it is nested in or None
+        self.frames  = [[0, 0]] # [start, time of nested statements] of each running statement
+        todo = [(prog.stmt, None)]
+        while todo:
+            (stmt, parent) = todo.pop()
+            if isinstance(stmt, STMTS):
+                self.stats[stmt]   = Stats()
+                self.parents[stmt] = parent
+                todo.extend((kid, stmt) for kid in reversed(opt.kids(stmt)))
+
+    def enter(self):
+        self.frames.append([perf_counter_ns(), 0])
+
+    def leave(self, stmt):
+        (start, nested) = self.frames.pop()
+        time   = perf_counter_ns() - start
+        stats  = self.stats[stmt]
+        stats.count += 1
+        stats.total += time
+        stats.own   += time - nested
+        self.frames[-1][1] += time
+
+    def run(self, closure = False):
+        """Evaluates the Prog with the tree or, if closure, with the closure engine and returns its result."""
+        if closure:
+            with self.hooks("closure", self.hook_closure):
+                fn = self.prog.closure()
+            return fn()
+        with self.hooks("eval", self.hook_eval):
+            return self.prog.eval()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def hooks(method, hook):
+        origs = {cls: cls.__dict__[method] for cls in STMTS}
+        try:
+            for (cls, orig) in origs.items():
+                setattr(cls, method, hook(orig))
+            yield
+        finally:
+            for (cls, orig) in origs.items():
+                setattr(cls, method, orig)
+
+    def hook_eval(self, orig):
+        (enter, leave) = (self.enter, self.leave)
+
+        def eval_(stmt, env):
+            enter()
+            yield orig(stmt, env)
+            leave(stmt)
+        return eval_
+
+    def hook_closure(self, orig):
+        (enter, leave) = (self.enter, self.leave)
+
+        def closure(stmt):
+            fn = yield orig(stmt)
+
+            def timed(env):
+                enter()
+                fn(env)
+                leave(stmt)
+            return timed
+        return closure
+
+    def iterations(self, stmt):
+        return self.stats[stmt.body].count if isinstance(stmt, WhileStmt) else None
+
+    def report(self, out):
+        """Writes the statements that took the most time of their own to out along with the start of their source."""
+        total = max(self.stats[self.prog.stmt].total, 1)
+        stmts = [stmt for (stmt, stats) in self.stats.items() if stats.count != 0 and not isinstance(stmt, StmtList)]
+        stmts.sort(key=lambda stmt: self.stats[stmt].own, reverse=True)
+        execs = sum(self.stats[stmt].count for stmt in stmts)
+        out.write(f"profile: {total / 1e6:.3f} ms in {execs} statement execution(s)\n")
+        out.write(f"{'own ms':>10} {'%':>6} {'total ms':>10} {'count':>10} {'iterations':>10} {'us/iter':>8}  location: source\n")
+        for stmt in stmts[:TOP]:
+            stats = self.stats[stmt]
+            if (iters := self.iterations(stmt)) is not None:
+                loop = f"{iters:>10} {stats.total / 1e3 / max(iters, 1):>8.3f}"
+            else:
+                loop = f"{'':>10} {'':>8}"
+            pos  = stmt.loc.file.pos(stmt.loc.begin)
+            line = stmt.loc.file.line(pos.row)[pos.col - 1:].rstrip()
+            out.write(f"{stats.own / 1e6:>10.3f} {100 * stats.own / total:>5.1f}% {stats.total / 1e6:>10.3f} {stats.count:>10} "
+                      f"{loop}  {stmt.loc.file}:{pos}: {line[:60]}\n")
+        if len(stmts) > TOP:
+            out.write(f"... and {len(stmts) - TOP} more statement(s)\n")
+
+    def dump(self, out):
+        """
+        Writes the own time of the statements in ns to out as collapsed stacks - one line 'frame;frame;... time'
+        per statement -, which flame graph tools like flamegraph.pl or speedscope read.
+        """
+        root   = f"{self.prog.loc.file}"
+        stacks = {}   # Stmt -> its frames; parents come first in self.stats
+        times  = {}   # frames -> own time
+        for (stmt, stats) in self.stats.items():
+            stack = root if (parent := self.parents[stmt]) is None else stacks[parent]
+            if not isinstance(stmt, StmtList): # the own time of a block is that of the statement it belongs to
+                pos   = stmt.loc.file.pos(stmt.loc.begin)
+                stack = f"{stack};{KINDS[type(stmt)]} {stmt.loc.file}:{pos}"
+            stacks[stmt] = stack
+            if stats.own != 0:
+                times[stack] = times.get(stack, 0) + stats.own
+        for (stack, time) in times.items():
+            out.write(f"{stack} {time}\n")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compile server: runs the command lines client.py sends over a Unix socket in one long-running process,
+which saves starting Python and importing the compiler for each of them.
+The most recently used cache entries stay in memory, so compiling an unchanged file again does not even read the cache.
+
+A request is a dict {"argv": [...], "cwd": "...", "cc": $CC or None, "sources": {file: text}} - sources is optional and
+replaces the contents of input files, e.g. with the unsaved buffer of an editor.
+The reply is a dict {"stdout": bytes, "stderr": str, "status": exit status}.
+Requests are handled one after another; see client.py for the encoding.
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+import cache
+import client
+import driver
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        if (request := client.recv(self.request)) is not None:
+            client.send(self.request, run(request))
+
+def run(request):
+    """Runs the command line of request in its working directory and returns the reply."""
+    (out, error) = (io.BytesIO(), io.StringIO())
+    stdout = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    status = 0
+    cwd    = os.getcwd()
+    argv   = ["--cc", request.get("cc") or "cc", *request["argv"]] # the client's $CC; a --cc of its own comes later and wins
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(error):
+        try:
+            os.chdir(request["cwd"])
+            driver.main(argv, request.get("sources"))
+        except SystemExit as exit_:
+            status = driver.exit_status(exit_)
+        except Exception as exc: # pylint: disable=broad-except # a bug must not take down the server
+            status = 1
+            print(f"error: internal compiler error: {exc!r}", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return {"stdout": out.getvalue(), "stderr": error.getvalue(), "status": status}
+
+def is_listening(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+def main():
+    cli = argparse.ArgumentParser(description="Compile server for client.py.")
+    cli.add_argument("--socket", action="store", metavar="path", dest="socket", default=client.socket_path(),
+                     help=f"Unix socket to listen on (default: $WHILEC_SOCKET or {client.socket_path()})")
+    args = cli.parse_args()
+
+    cache.MEMORY = collections.OrderedDict()
+    cache.compiler_version() # hash the compiler once and for all
+    if is_listening(args.socket):
+        sys.exit(f"error: a server is already listening on {args.socket}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(args.socket) # left behind by a server that was killed
+    umask = os.umask(0o177) # only the user may connect
+    try:
+        server = socketserver.UnixStreamServer(args.socket, Handler)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit()) # clean up just like on ^C
+    with server:
+        print(f"listening on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
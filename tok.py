@@ -30,6 +30,7 @@ class Tag(Enum):
     T_ADD       = auto()
     T_SUB       = auto()
     T_MUL       = auto()
+    T_POW       = auto() # only introduced by the optimizer
     T_EQ        = auto()
     T_NE        = auto()
     T_LT        = auto()
@@ -39,79 +40,75 @@ class Tag(Enum):
     T_ASSIGN    = auto()
     T_SEMICOLON = auto()
 
+    # these look up the tables below instead of testing one Tag after another
+
     def __str__(self):
-        if self is self.D_BRACE_L:   return "{"
-        if self is self.D_BRACE_R:   return "}"
-        if self is self.D_PAREN_L:   return "("
-        if self is self.D_PAREN_R:   return ")"
-        if self is self.K_BOOL:      return "bool"
-        if self is self.K_INT:       return "int"
-        if self is self.K_AND:       return "and"
-        if self is self.K_OR:        return "or"
-        if self is self.K_NOT:       return "not"
-        if self is self.K_TRUE:      return "true"
-        if self is self.K_FALSE:     return "false"
-        if self is self.K_RETURN:    return "return"
-        if self is self.K_WHILE:     return "while"
-        if self is self.K_IF:        return "if"
-        if self is self.K_ELSE:      return "else"
-        if self is self.M_SYM:       return "<identifier>"
-        if self is self.M_LIT:       return "<literal>"
-        if self is self.M_EOF:       return "<end of file>"
-        if self is self.T_ADD:       return "+"
-        if self is self.T_SUB:       return "-"
-        if self is self.T_MUL:       return "*"
-        if self is self.T_EQ:        return "=="
-        if self is self.T_NE:        return "!="
-        if self is self.T_LT:        return "<"
-        if self is self.T_LE:        return "<="
-        if self is self.T_GT:        return ">"
-        if self is self.T_GE:        return ">="
-        if self is self.T_ASSIGN:    return "="
-        if self is self.T_SEMICOLON: return ";"
-        assert False
+        return STRS[self]
 
     def is_type(self):
-        return self is Tag.K_BOOL or self is Tag.K_INT
+        return self in TYPES
 
     def is_bin_op(self):
-        return self is self.T_ADD \
-            or self is self.T_SUB \
-            or self is self.T_MUL \
-            or self is self.T_EQ  \
-            or self is self.T_NE  \
-            or self is self.T_LT  \
-            or self is self.T_LE  \
-            or self is self.T_GT  \
-            or self is self.T_GE  \
-            or self is self.K_AND \
-            or self is self.K_OR
+        return self in BIN_OPS
 
     def is_arith(self):
-        return self is self.T_ADD \
-            or self is self.T_SUB \
-            or self is self.T_MUL
+        return self in ARITH
 
     def is_rel(self):
-        return self is self.T_EQ \
-            or self is self.T_NE \
-            or self is self.T_LT \
-            or self is self.T_LE \
-            or self is self.T_GT \
-            or self is self.T_GE
+        return self in REL
 
     def is_logic(self): # binary only - K_not is its own thing
-        return self is self.K_AND \
-            or self is self.K_OR
+        return self in LOGIC
 
     def is_unary(self):
-        return self is self.T_ADD \
-            or self is self.T_SUB \
-            or self is self.K_NOT
+        return self in UNARY
+
+STRS = {
+    Tag.D_BRACE_L:   "{",
+    Tag.D_BRACE_R:   "}",
+    Tag.D_PAREN_L:   "(",
+    Tag.D_PAREN_R:   ")",
+    Tag.K_BOOL:      "bool",
+    Tag.K_INT:       "int",
+    Tag.K_AND:       "and",
+    Tag.K_OR:        "or",
+    Tag.K_NOT:       "not",
+    Tag.K_TRUE:      "true",
+    Tag.K_FALSE:     "false",
+    Tag.K_RETURN:    "return",
+    Tag.K_WHILE:     "while",
+    Tag.K_IF:        "if",
+    Tag.K_ELSE:      "else",
+    Tag.M_SYM:       "<identifier>",
+    Tag.M_LIT:       "<literal>",
+    Tag.M_EOF:       "<end of file>",
+    Tag.T_ADD:       "+",
+    Tag.T_SUB:       "-",
+    Tag.T_MUL:       "*",
+    Tag.T_POW:       "**",
+    Tag.T_EQ:        "==",
+    Tag.T_NE:        "!=",
+    Tag.T_LT:        "<",
+    Tag.T_LE:        "<=",
+    Tag.T_GT:        ">",
+    Tag.T_GE:        ">=",
+    Tag.T_ASSIGN:    "=",
+    Tag.T_SEMICOLON: ";",
+}
+assert len(STRS) == len(Tag)
+
+TYPES   = frozenset({Tag.K_BOOL, Tag.K_INT})
+ARITH   = frozenset({Tag.T_ADD, Tag.T_SUB, Tag.T_MUL, Tag.T_POW})
+REL     = frozenset({Tag.T_EQ, Tag.T_NE, Tag.T_LT, Tag.T_LE, Tag.T_GT, Tag.T_GE})
+LOGIC   = frozenset({Tag.K_AND, Tag.K_OR})
+BIN_OPS = (ARITH - {Tag.T_POW}) | REL | LOGIC # T_POW is never parsed
+UNARY   = frozenset({Tag.T_ADD, Tag.T_SUB, Tag.K_NOT})
 
 class Tok:
+    __slots__ = ("loc", "tag", "sym", "val")
+
     def __init__(self, loc, arg):
-        self.loc = loc.copy()
+        self.loc = loc
 
         if isinstance(arg, str):
             self.tag = Tag.M_SYM
@@ -0,0 +1,41 @@
+"""
+Helper to run deep recursions without growing the Python stack.
+
+A recursive function is written as a generator that yields the generator of each
+recursive call instead of calling it directly; run drives all of them with an explicit
+stack and sends the result of each call back into its caller:
+
+    def depth(node):
+        res = 0
+        for kid in node.kids:
+            res = max(res, (yield depth(kid)))
+        return res + 1
+
+    run(depth(root))
+
+Yielding a plain value (e.g. the result of a non-recursive leaf function) sends it right back.
+"""
+
+from types import GeneratorType
+
+def run(gen):
+    if not isinstance(gen, GeneratorType):
+        return gen
+
+    stack = [gen]
+    val   = None
+    while True:
+        try:
+            sub = stack[-1].send(val)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            val = stop.value
+            continue
+
+        if isinstance(sub, GeneratorType):
+            stack.append(sub)
+            val = None
+        else:
+            val = sub
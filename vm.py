@@ -0,0 +1,305 @@
+"""
+Lowers a checked Prog to a flat register bytecode and runs it in a dispatch loop.
+"""
+
+from array import array
+import struct
+import sys
+
+from tok import Tag
+from while_ast import Prog,                    \
+    DeclStmt, AssignStmt, StmtList, WhileStmt, \
+    IfStmt, IfElseStmt,                        \
+    BinExpr, UnaryExpr, BoolExpr, LitExpr, SymExpr
+import trampoline
+
+# opcodes - each instruction is made of 4 words: opcode, a, b, c
+
+MOVE        =  0 # r[a] = r[b]
+ADD         =  1 # r[a] = r[b] +   r[c]
+SUB         =  2 # r[a] = r[b] -   r[c]
+MUL         =  3 # r[a] = r[b] *   r[c]
+AND         =  4 # r[a] = r[b] &   r[c]
+OR          =  5 # r[a] = r[b] |   r[c]
+EQ          =  6 # r[a] = r[b] ==  r[c]
+NE          =  7 # r[a] = r[b] !=  r[c]
+LT          =  8 # r[a] = r[b] <   r[c]
+LE          =  9 # r[a] = r[b] <=  r[c]
+GT          = 10 # r[a] = r[b] >   r[c]
+GE          = 11 # r[a] = r[b] >=  r[c]
+NOT         = 12 # r[a] = not r[b]
+NEG         = 13 # r[a] = -r[b]
+JUMP        = 14 # goto a
+JUMP_IF     = 15 # if     r[a]: goto b
+JUMP_IF_NOT = 16 # if not r[a]: goto b
+RETURN      = 17 # return r[a]
+POW         = 18 # r[a] = r[b] **  r[c]
+
+NAMES = ["move", "add", "sub", "mul", "and", "or", "eq", "ne", "lt", "le", "gt", "ge",
+         "not", "neg", "jump", "jump_if", "jump_if_not", "return", "pow"]
+
+# number of register operands of each opcode; jump targets are not registers
+ARITY = [2, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 2, 2, 0, 1, 1, 1, 3]
+
+BIN_OPS = {
+    Tag.T_ADD: ADD,
+    Tag.T_SUB: SUB,
+    Tag.T_MUL: MUL,
+    Tag.T_POW: POW,
+    Tag.K_AND: AND,
+    Tag.K_OR : OR,
+    Tag.T_EQ : EQ,
+    Tag.T_NE : NE,
+    Tag.T_LT : LT,
+    Tag.T_LE : LE,
+    Tag.T_GT : GT,
+    Tag.T_GE : GE,
+}
+
+MAGIC   = b"WHBC"
+VERSION = 1
+
+def is_bytecode(filename):
+    with open(filename, "rb") as in_file:
+        return in_file.read(len(MAGIC)) == MAGIC
+
+class Code:
+    def __init__(self, code, consts, num_regs):
+        self.code     = code     # array of 4 words per instruction
+        self.consts   = consts   # list of (register, value) to preload
+        self.num_regs = num_regs
+
+    def __str__(self):
+        res = f"; {self.num_regs} registers, {len(self.consts)} constants, {len(self.code) // 4} instructions\n"
+        for reg, val in self.consts:
+            res += f"r{reg} = {'true' if val is True else 'false' if val is False else val}\n"
+
+        for i in range(0, len(self.code), 4):
+            op, a, b, c = self.code[i:i+4]
+            regs = [f"r{x}" for x in (a, b, c)[:ARITY[op]]]
+            if op == JUMP:
+                regs.append(f"@{a}")
+            elif op in (JUMP_IF, JUMP_IF_NOT):
+                regs.append(f"@{b}")
+            res += f"{i // 4:6}  {NAMES[op]:12}{', '.join(regs)}\n"
+        return res
+
+    # serialization
+
+    def save(self, file):
+        file.write(MAGIC)
+        file.write(struct.pack("<HIII", VERSION, self.num_regs, len(self.consts), len(self.code) // 4))
+        for reg, val in self.consts:
+            data = int(val).to_bytes((int(val).bit_length() + 8) // 8, "little", signed=True)
+            file.write(struct.pack("<IBI", reg, isinstance(val, bool), len(data)))
+            file.write(data)
+        code = array("i", self.code)
+        if sys.byteorder == "big":
+            code.byteswap()
+        file.write(code.tobytes())
+
+    @staticmethod
+    def load(file):
+        def read(fmt):
+            return struct.unpack(fmt, file.read(struct.calcsize(fmt)))
+
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a While bytecode file")
+        (version, num_regs, num_consts, num_insns) = read("<HIII")
+        if version != VERSION:
+            raise ValueError(f"unsupported bytecode version {version}")
+
+        consts = []
+        for _ in range(num_consts):
+            (reg, is_bool, size) = read("<IBI")
+            val = int.from_bytes(file.read(size), "little", signed=True)
+            consts.append((reg, bool(val) if is_bool else val))
+
+        code = array("i")
+        code.frombytes(file.read(num_insns * 4 * code.itemsize))
+        if sys.byteorder == "big":
+            code.byteswap()
+        return Code(code, consts, num_regs)
+
+    # execution
+
+    def run(self):
+        regs = [None] * self.num_regs
+        for reg, val in self.consts:
+            regs[reg] = val
+
+        c_ = self.code
+        code = [(c_[i], c_[i+1], c_[i+2], c_[i+3]) for i in range(0, len(c_), 4)]
+        pc = 0
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            # most frequent instructions first
+            if op == ADD:
+                regs[a] = regs[b] + regs[c]
+            elif op == LT:
+                regs[a] = regs[b] < regs[c]
+            elif op == JUMP_IF:
+                if regs[a]: pc = b
+            elif op == JUMP_IF_NOT:
+                if not regs[a]: pc = b
+            elif op == MOVE:
+                regs[a] = regs[b]
+            elif op == SUB:
+                regs[a] = regs[b] - regs[c]
+            elif op == MUL:
+                regs[a] = regs[b] * regs[c]
+            elif op == LE:
+                regs[a] = regs[b] <= regs[c]
+            elif op == GT:
+                regs[a] = regs[b] > regs[c]
+            elif op == GE:
+                regs[a] = regs[b] >= regs[c]
+            elif op == EQ:
+                regs[a] = regs[b] == regs[c]
+            elif op == NE:
+                regs[a] = regs[b] != regs[c]
+            elif op == AND:
+                regs[a] = regs[b] & regs[c]
+            elif op == OR:
+                regs[a] = regs[b] | regs[c]
+            elif op == NOT:
+                regs[a] = not regs[b]
+            elif op == NEG:
+                regs[a] = -regs[b]
+            elif op == JUMP:
+                pc = a
+            elif op == RETURN:
+                return regs[a]
+            elif op == POW:
+                regs[a] = regs[b] ** regs[c]
+            else:
+                assert False
+
+class Compiler:
+    """
+    Registers [0, prog.num_slots) hold the variables;
+    constants and temporaries are allocated behind them.
+    """
+
+    def __init__(self, prog):
+        self.code     = array("i")
+        self.consts   = {} # (type, value) -> register
+        self.temps    = set()
+        self.free     = []
+        self.num_regs = prog.num_slots
+
+    def compile(self, prog):
+        assert isinstance(prog, Prog)
+        trampoline.run(self.stmt(prog.stmt))
+        self.emit(RETURN, trampoline.run(self.expr(prog.ret)))
+        consts = [(reg, val) for ((_, val), reg) in self.consts.items()]
+        return Code(self.code, consts, self.num_regs)
+
+    # helpers
+
+    def emit(self, op, a = 0, b = 0, c = 0):
+        self.code.extend((op, a, b, c))
+        return len(self.code) // 4 - 1
+
+    def label(self):
+        return len(self.code) // 4
+
+    def patch(self, insn, word, target):
+        self.code[insn * 4 + word] = target
+
+    def const(self, val):
+        key = (type(val), val) # keep True and 1 apart
+        if key not in self.consts:
+            self.consts[key] = self.num_regs
+            self.num_regs += 1
+        return self.consts[key]
+
+    def temp(self):
+        if self.free:
+            return self.free.pop()
+        reg = self.num_regs
+        self.num_regs += 1
+        self.temps.add(reg)
+        return reg
+
+    def release(self, *regs):
+        for reg in regs:
+            if reg in self.temps and reg not in self.free:
+                self.free.append(reg)
+
+    # Stmt
+    #
+    # stmt and expr are generators that yield nested calls; compile drives them with trampoline.run.
+
+    def stmt(self, stmt):
+        if isinstance(stmt, StmtList):
+            for s in stmt.stmts:
+                yield self.stmt(s)
+        elif isinstance(stmt, DeclStmt):
+            yield self.expr(stmt.init, stmt.slot)
+        elif isinstance(stmt, AssignStmt):
+            yield self.expr(stmt.init, stmt.decl.slot)
+        elif isinstance(stmt, WhileStmt):
+            # test at the bottom: one jump per iteration
+            head = self.emit(JUMP)
+            body = self.label()
+            yield self.stmt(stmt.body)
+            self.patch(head, 1, self.label())
+            cond = yield self.expr(stmt.cond)
+            self.emit(JUMP_IF, cond, body)
+            self.release(cond)
+        elif isinstance(stmt, IfStmt):
+            cond = yield self.expr(stmt.cond)
+            self.release(cond)
+            skip = self.emit(JUMP_IF_NOT, cond)
+            yield self.stmt(stmt.body)
+            self.patch(skip, 2, self.label())
+        elif isinstance(stmt, IfElseStmt):
+            cond = yield self.expr(stmt.cond)
+            self.release(cond)
+            skip = self.emit(JUMP_IF_NOT, cond)
+            yield self.stmt(stmt.body)
+            done = self.emit(JUMP)
+            self.patch(skip, 2, self.label())
+            yield self.stmt(stmt.alt_body)
+            self.patch(done, 1, self.label())
+        else:
+            assert False
+
+    # Expr
+
+    def expr(self, expr, dst = None):
+        """
+        Returns the register that holds the value of expr.
+        If dst is given, the value is computed into dst.
+        """
+        if isinstance(expr, (LitExpr, BoolExpr)):
+            src = self.const(expr.val)
+        elif isinstance(expr, SymExpr):
+            src = expr.decl.slot
+        elif isinstance(expr, UnaryExpr) and expr.op is Tag.T_ADD:
+            return (yield self.expr(expr.rhs, dst))
+        elif isinstance(expr, UnaryExpr):
+            r = yield self.expr(expr.rhs)
+            self.release(r)
+            dst = self.temp() if dst is None else dst
+            self.emit(NOT if expr.op is Tag.K_NOT else NEG, dst, r)
+            return dst
+        elif isinstance(expr, BinExpr):
+            l = yield self.expr(expr.lhs)
+            r = yield self.expr(expr.rhs)
+            self.release(l, r)
+            dst = self.temp() if dst is None else dst
+            self.emit(BIN_OPS[expr.op], dst, l, r)
+            return dst
+        else:
+            assert False
+
+        if dst is not None and dst != src:
+            self.emit(MOVE, dst, src)
+            return dst
+        return src
+
+def compile_prog(prog):
+    return Compiler(prog).compile(prog)
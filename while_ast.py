@@ -3,16 +3,24 @@ The While AST (Abstract Syntax Tree)
 """
 
 from enum import Enum, auto
+import io
 from tok import Tag
 from err import err, note
+import trampoline
 
 def same(t, u):
     return t is None or u is None or t == u
 
-class Tab:
-    def __init__(self, tab = "\t"):
-        self.ind = 0
-        self.tab = tab
+class Writer:
+    """
+    Writes the fragments of an emitter in order to the text sink file - a file, sys.stdout or an io.StringIO.
+    The emitters only indent and dedent; indented writes the indentation at the start of a line.
+    """
+
+    def __init__(self, file, tab = "\t"):
+        self.write = file.write
+        self.tab   = tab
+        self.ind   = 0
 
     def indent(self):
         self.ind += 1
@@ -20,29 +28,44 @@ class Tab:
     def dedent(self):
         self.ind -= 1
 
-    def __str__(self):
-        res = ""
-        for _ in range(self.ind):
-            res += self.tab
-        return res
+    def indented(self, text = ""):
+        self.write(self.tab * self.ind + text)
+
+def py_main(ty, tab):
+    """Prints the result of main when the Python output runs as a script - as opposed to --eval-py."""
+    res = 'if __name__ == "__main__":\n'
+    if ty is Tag.K_BOOL:
+        return res + f'{tab}print("true" if main() else "false")\n'
+    return res + f"{tab}print(main())\n"
 
 class Sema:
     def __init__(self):
-        self.scopes = []
+        self.scopes    = [] # name -> decl for each scope; the keys of an inner scope undo its bindings in inner once it is popped
+        self.inner     = {} # name -> decls of the inner scopes binding it, innermost last
+        self.marks     = []
+        self.num_slots = 0 # slots currently in use
+        self.max_slots = 0 # size of the environment needed to run the program
         self.push() # root scope
 
     def push(self):
         self.scopes.append({})
+        self.marks.append(self.num_slots)
 
     def pop(self):
-        self.scopes.pop()
+        for sym in self.scopes.pop():
+            decls = self.inner[sym]
+            decls.pop()
+            if not decls:
+                del self.inner[sym]
+        self.num_slots = self.marks.pop() # slots of an inner scope are free again
 
     def find(self, tok):
         if tok.is_error(): return None
 
-        for scope in reversed(self.scopes):
-            if tok.sym in scope:
-                return scope[tok.sym]
+        if (decls := self.inner.get(tok.sym)) is not None:
+            return decls[-1]
+        if tok.sym in self.scopes[0]:
+            return self.scopes[0][tok.sym]
 
         err(tok.loc, f"identifier '{tok}' not found")
         return None
@@ -60,73 +83,161 @@ class Sema:
             return False
 
         curr_scope[tok.sym] = decl
+        if len(self.scopes) > 1:
+            self.inner.setdefault(tok.sym, []).append(decl)
+        self.alloc(decl)
         return True
 
+    def alloc(self, decl):
+        decl.slot       = self.num_slots
+        self.num_slots += 1
+        self.max_slots  = max(self.max_slots, self.num_slots)
+
 class Emit(Enum):
     EVAL  = auto()
     WHILE = auto()
     C     = auto()
     PY    = auto()
+    IR    = auto() # only understood by ir.Func
 
-TAB  = Tab()
 EMIT = Emit.WHILE
 
+# C lacks integer exponentiation - Prog.emit prepends this helper if uses_pow
+C_POW = """static int while_pow(int b, int e) {
+	unsigned res = 1, x = b; // wraps around just like repeated multiplication
+	for (; e > 0; e >>= 1) {
+		if (e & 1) res *= x;
+		x *= x;
+	}
+	return (int) res;
+}
+
+"""
+
+def uses_pow(prog):
+    """Whether a BinExpr in prog computes a power; the helper must be written before any of them is emitted."""
+    stack = [prog.stmt, prog.ret]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, StmtList):
+            stack.extend(node.stmts)
+        elif isinstance(node, (DeclStmt, AssignStmt)):
+            stack.append(node.init)
+        elif isinstance(node, (WhileStmt, IfStmt)):
+            stack.extend((node.cond, node.body))
+        elif isinstance(node, IfElseStmt):
+            stack.extend((node.cond, node.body, node.alt_body))
+        elif isinstance(node, BinExpr):
+            if node.op is Tag.T_POW:
+                return True
+            stack.extend((node.lhs, node.rhs))
+        elif isinstance(node, UnaryExpr):
+            stack.append(node.rhs)
+    return False
+
 # AST
+#
+# Traversals never recurse directly: check, eval, closure and emit yield the
+# generator of each child visit and are driven by trampoline.run - see there.
+# emit writes the text in order to the Writer out, so long programs are neither copied over and over
+# nor materialized in memory at all if out writes to a file.
 
 class AST:
+    __slots__ = ("loc",)
+
     def __init__(self, loc):
         self.loc = loc
 
+    def write(self, file):
+        """Emits self as EMIT to file."""
+        trampoline.run(self.emit(Writer(file))) # pylint: disable=no-member
+
+    def __str__(self):
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
+
 class Prog(AST):
+    __slots__ = ("stmt", "ret", "num_slots")
+
     def __init__(self, loc, stmt, ret):
         super().__init__(loc)
         self.stmt = stmt
         self.ret  = ret
+        self.num_slots = 0
 
-    def __str__(self):
-        res = ""
-
+    def emit(self, out):
         if EMIT is Emit.C:
-            res += "#include <stdbool.h>\n"
-            res += "#include <stdio.h>\n"
-            res += "\n"
-            res += "int main() {\n"
-            TAB.indent()
-
-        res += f"{self.stmt}"
+            out.write("#include <stdbool.h>\n")
+            out.write("#include <stdio.h>\n")
+            out.write("\n")
+            if uses_pow(self):
+                out.write(C_POW)
+            out.write("int main() {\n")
+            out.indent()
+        elif EMIT is Emit.PY: # variables become locals of main, which are much faster than globals
+            out.write("def main():\n")
+            out.indent()
+
+        yield self.stmt.emit(out)
 
         if EMIT is Emit.WHILE:
-            res += f"{TAB}return {self.ret};\n"
+            out.indented("return ")
+            yield self.ret.emit(out)
+            out.write(";\n")
         elif EMIT is Emit.C:
+            out.indented("printf(")
             if self.ret.ty == Tag.K_BOOL:
-                res += f'{TAB}printf({self.ret} ? "true\\n" : "false\\n");'
+                yield self.ret.emit(out)
+                out.write(' ? "true\\n" : "false\\n");')
             else:
-                res += f'{TAB}printf("%i\\n", {self.ret});'
+                out.write('"%i\\n", ')
+                yield self.ret.emit(out)
+                out.write(");")
         elif EMIT is Emit.PY:
-            if self.ret.ty is Tag.K_BOOL:
-                res += f'{TAB}print("true" if {self.ret} else "false")\n'
-            else:
-                res += f'{TAB}print({self.ret})\n'
+            out.indented("return ")
+            yield self.ret.emit(out)
+            out.write("\n")
+            out.dedent()
+            out.write("\n")
+            out.write(py_main(self.ret.ty, out.tab))
 
         if EMIT is Emit.C:
-            TAB.dedent()
-            res += "\n}\n"
-        return res
+            out.dedent()
+            out.write("\n}\n")
 
     def check(self):
         sema = Sema()
-        self.stmt.check(sema)
-        self.ret.check(sema)
+        trampoline.run(self.stmt.check(sema))
+        trampoline.run(self.ret.check(sema))
+        self.num_slots = sema.max_slots
 
     def eval(self):
         assert EMIT is Emit.EVAL
-        env = {}
-        self.stmt.eval(env)
-        print(self.ret.eval(env))
+        env = [None] * self.num_slots
+        trampoline.run(self.stmt.eval(env))
+        return trampoline.run(self.ret.eval(env))
+
+    def closure(self):
+        """
+        Note that the closures themselves call each other,
+        so running them needs Python stack proportional to the nesting depth.
+        """
+        assert EMIT is Emit.EVAL
+        stmt = trampoline.run(self.stmt.closure())
+        ret  = trampoline.run(self.ret.closure())
+        num_slots = self.num_slots
+
+        def fn():
+            env = [None] * num_slots
+            stmt(env)
+            return ret(env)
+        return fn
 
 # Stmt
 
-class Stmt(AST): pass
+class Stmt(AST):
+    __slots__ = ()
 
 DECL_COUNTER = 0
 
@@ -134,224 +245,317 @@ def name(decl, sym = None):
     if decl is None:                         return f"{sym}"
     if EMIT is Emit.WHILE:                   return f"{decl.sym}"
     if EMIT is Emit.C:                       return f"_{decl.sym}"
-    if EMIT is Emit.EVAL or EMIT is Emit.PY: return f"{decl.sym}_{decl.counter}"
+    if EMIT is Emit.PY:                      return f"{decl.sym}_{decl.counter}"
     assert False
 
 class DeclStmt(Stmt):
+    __slots__ = ("ty", "sym", "init", "slot", "counter")
+
     def __init__(self, loc, ty, sym, init):
         global DECL_COUNTER
         super().__init__(loc)
         self.ty   = ty
         self.sym  = sym
         self.init = init
+        self.slot = None # assigned by Sema.bind
         self.counter = DECL_COUNTER
         DECL_COUNTER += 1
 
-    def __str__(self):
-        if EMIT is Emit.PY: return f"{name(self)} = {self.init}"
-        return f"{self.ty} {name(self)} = {self.init};"
+    def emit(self, out):
+        if EMIT is Emit.PY:
+            out.write(f"{name(self)} = ")
+            yield self.init.emit(out)
+        else:
+            out.write(f"{self.ty} {name(self)} = ")
+            yield self.init.emit(out)
+            out.write(";")
 
     def check(self, sema):
-        init_ty = self.init.check(sema)
+        init_ty = yield self.init.check(sema)
         if not same(init_ty, self.ty):
             err(self.loc, f"initialization of declaration statement is of type '{init_ty}' but '{self.sym}' is declared of type '{self.ty}'")
         sema.bind(self.sym, self)
 
     def eval(self, env):
-        val = self.init.eval(env)
-        env[name(self)] = val
+        env[self.slot] = yield self.init.eval(env)
+
+    def closure(self):
+        slot = self.slot
+        init = yield self.init.closure()
+
+        def fn(env):
+            env[slot] = init(env)
+        return fn
 
 class AssignStmt(Stmt):
+    __slots__ = ("sym", "init", "decl")
+
     def __init__(self, loc, sym, init):
         super().__init__(loc)
         self.sym  = sym
         self.init = init
         self.decl = None
 
-    def __str__(self):
-        if EMIT is Emit.PY:
-            return f"{name(self.decl, self.sym)} = {self.init}"
-        return f"{name(self.decl, self.sym)} = {self.init};"
+    def emit(self, out):
+        out.write(f"{name(self.decl, self.sym)} = ")
+        yield self.init.emit(out)
+        if EMIT is not Emit.PY:
+            out.write(";")
 
     def check(self, sema):
-        init_ty = self.init.check(sema)
+        init_ty = yield self.init.check(sema)
         self.decl = sema.find(self.sym)
-        if not same(init_ty, self.decl.ty):
+        if self.decl is not None and not same(init_ty, self.decl.ty):
             err(self.loc, f"right-hand side of asssignment statement is of type '{init_ty}' but '{self.decl.sym}' is declared of type '{self.decl.ty}'")
             note(self.decl.loc, "previous declaration here")
 
     def eval(self, env):
-        val = self.init.eval(env)
-        env[name(self.decl)] = val
+        env[self.decl.slot] = yield self.init.eval(env)
+
+    def closure(self):
+        slot = self.decl.slot
+        init = yield self.init.closure()
+
+        def fn(env):
+            env[slot] = init(env)
+        return fn
 
 class StmtList(Stmt):
+    __slots__ = ("stmts",)
+
     def __init__(self, loc, stmts):
         super().__init__(loc)
         self.stmts = stmts
 
-    def __str__(self):
-        res = ""
+    def emit(self, out):
+        if EMIT is Emit.PY and not self.stmts:
+            out.indented("pass\n")
         for stmt in self.stmts:
-            res += f"{TAB}{stmt}\n"
-        return res
+            out.indented()
+            yield stmt.emit(out)
+            out.write("\n")
 
     def check(self, sema):
         for stmt in self.stmts:
-            stmt.check(sema)
+            yield stmt.check(sema)
 
     def eval(self, env):
         for stmt in self.stmts:
-            stmt.eval(env)
+            yield stmt.eval(env)
+
+    def closure(self):
+        stmts = []
+        for stmt in self.stmts:
+            stmts.append((yield stmt.closure()))
+        stmts = tuple(stmts)
+
+        def fn(env):
+            for stmt in stmts:
+                stmt(env)
+        return fn
 
 class WhileStmt(Stmt):
+    __slots__ = ("cond", "body")
+
     def __init__(self, loc, cond, body):
         super().__init__(loc)
         self.cond = cond
         self.body = body
 
-    def __str__(self):
+    def emit(self, out):
+        out.write("while (" if EMIT is Emit.C else "while ")
+        yield self.cond.emit(out)
         if EMIT is Emit.WHILE:
-            head = f"while {self.cond} {{\n"
+            out.write(" {\n")
         elif EMIT is Emit.C:
-            head = f"while ({self.cond}) {{\n"
+            out.write(") {\n")
         else:
-            head = f"while {self.cond}:\n"
+            out.write(":\n")
 
-        TAB.indent()
-        body = f"{self.body}"
-        TAB.dedent()
-        tail = "" if EMIT is Emit.PY else f"{TAB}}}"
-        return head + body + tail
+        out.indent()
+        yield self.body.emit(out)
+        out.dedent()
+        if EMIT is not Emit.PY:
+            out.indented("}")
 
     def check(self, sema):
-        cond_ty = self.cond.check(sema)
+        cond_ty = yield self.cond.check(sema)
         if not same(cond_ty, Tag.K_BOOL):
             err(self.cond.loc, f"condition of a while statement must be of type `bool` but is of type '{cond_ty}'")
 
         sema.push()
-        self.body.check(sema)
+        yield self.body.check(sema)
         sema.pop()
 
     def eval(self, env):
         while True:
-            if not self.cond.eval(env): break
-            self.body.eval(env)
+            if not (yield self.cond.eval(env)): break
+            yield self.body.eval(env)
+
+    def closure(self):
+        cond = yield self.cond.closure()
+        body = yield self.body.closure()
+
+        def fn(env):
+            while cond(env):
+                body(env)
+        return fn
 
 class IfStmt(Stmt):
+    __slots__ = ("cond", "body")
+
     def __init__(self, loc, cond, body):
         super().__init__(loc)
         self.cond = cond
         self.body = body
 
-    def __str__(self):
+    def emit(self, out):
+        out.write("if (" if EMIT is Emit.C else "if ")
+        yield self.cond.emit(out)
         if EMIT is Emit.WHILE:
-            head = f"if {self.cond} {{\n"
+            out.write(" {\n")
         elif EMIT is Emit.C:
-            head = f"if ({self.cond}) {{\n"
+            out.write(") {\n")
         else:
-            head = f"if {self.cond}:\n"
+            out.write(":\n")
 
-        TAB.indent()
-        body = f"{self.body}"
-        TAB.dedent()
-        tail = "" if EMIT is Emit.PY else f"{TAB}}}"
-        return head + body + tail
+        out.indent()
+        yield self.body.emit(out)
+        out.dedent()
+        if EMIT is not Emit.PY:
+            out.indented("}")
 
     def check(self, sema):
-        cond_ty = self.cond.check(sema)
+        cond_ty = yield self.cond.check(sema)
         if not same(cond_ty, Tag.K_BOOL):
             err(self.cond.loc, f"condition of an if statement must be of type `bool` but is of type '{cond_ty}'")
 
         sema.push()
-        self.body.check(sema)
+        yield self.body.check(sema)
         sema.pop()
 
     def eval(self, env):
-        if self.cond.eval(env):
-            self.body.eval(env)
-         
+        if (yield self.cond.eval(env)):
+            yield self.body.eval(env)
+
+    def closure(self):
+        cond = yield self.cond.closure()
+        body = yield self.body.closure()
+
+        def fn(env):
+            if cond(env):
+                body(env)
+        return fn
+
 class IfElseStmt(Stmt):
+    __slots__ = ("cond", "body", "alt_body")
+
     def __init__(self, loc, cond, body, alt_body):
         super().__init__(loc)
         self.cond = cond
         self.body = body
         self.alt_body = alt_body
 
-    def __str__(self):
+    def emit(self, out):
+        out.write("if (" if EMIT is Emit.C else "if ")
+        yield self.cond.emit(out)
         if EMIT is Emit.WHILE:
-            head = f"if {self.cond} {{\n"
+            out.write(" {\n")
         elif EMIT is Emit.C:
-            head = f"if ({self.cond}) {{\n"
+            out.write(") {\n")
         else:
-            head = f"if {self.cond}:\n"
-
-        TAB.indent()
-        body = f"{self.body}"
-        TAB.dedent()
-        
-        if_tail = "" if EMIT is Emit.PY else f"{TAB}}}"
-        
-        if EMIT is Emit.WHILE:
-            second_head = f"else {{\n"
-        elif EMIT is Emit.C:
-            second_head = f"else {{\n"
+            out.write(":\n")
+
+        out.indent()
+        yield self.body.emit(out)
+        out.dedent()
+
+        if EMIT is Emit.PY:
+            out.indented("else:\n")
         else:
-            second_head = f"else :\n"
-            
-        TAB.indent()
-        alt_body = f"{self.alt_body}"
-        TAB.dedent()
-        
-        else_tail = "" if EMIT is Emit.PY else f"{TAB}}}"
-        return head + body + if_tail + second_head + alt_body + else_tail
+            out.indented("}else {\n")
+
+        out.indent()
+        yield self.alt_body.emit(out)
+        out.dedent()
+
+        if EMIT is not Emit.PY:
+            out.indented("}")
 
     def check(self, sema):
-        cond_ty = self.cond.check(sema)
+        cond_ty = yield self.cond.check(sema)
         if not same(cond_ty, Tag.K_BOOL):
             err(self.cond.loc, f"condition of an if statement must be of type `bool` but is of type '{cond_ty}'")
 
         sema.push()
-        self.body.check(sema)
+        yield self.body.check(sema)
         sema.pop()
-        
+
         sema.push()
-        self.alt_body.check(sema)
+        yield self.alt_body.check(sema)
         sema.pop()
 
     def eval(self, env):
-        if self.cond.eval(env):
-            self.body.eval(env)
+        if (yield self.cond.eval(env)):
+            yield self.body.eval(env)
         else:
-            self.alt_body.eval(env)
+            yield self.alt_body.eval(env)
+
+    def closure(self):
+        cond     = yield self.cond.closure()
+        body     = yield self.body.closure()
+        alt_body = yield self.alt_body.closure()
+
+        def fn(env):
+            if cond(env):
+                body(env)
+            else:
+                alt_body(env)
+        return fn
 
 # Expr
 
 class Expr(AST):
+    __slots__ = ("ty",)
+
     def __init__(self, loc):
         super().__init__(loc)
         self.ty = None
 
 class BinExpr(Expr):
+    __slots__ = ("lhs", "op", "rhs")
+
     def __init__(self, loc, lhs, op, rhs):
         super().__init__(loc)
         self.lhs = lhs
         self.op  = op
         self.rhs = rhs
 
-    def __str__(self):
+    def emit(self, out):
         op = str(self.op)
 
         if EMIT is Emit.C:
+            if self.op is Tag.T_POW:
+                out.write("while_pow(")
+                yield self.lhs.emit(out)
+                out.write(", ")
+                yield self.rhs.emit(out)
+                out.write(")")
+                return
             if self.op is Tag.K_AND:
                 op = "&"
             elif self.op is Tag.K_OR:
                 op = "|"
 
-        return f"({self.lhs} {op} {self.rhs})"
+        out.write("(")
+        yield self.lhs.emit(out)
+        out.write(f" {op} ")
+        yield self.rhs.emit(out)
+        out.write(")")
 
     def check(self, sema):
-        l_ty  = self.lhs.check(sema)
-        r_ty  = self.rhs.check(sema)
+        l_ty  = yield self.lhs.check(sema)
+        r_ty  = yield self.rhs.check(sema)
 
         if self.op.is_arith():
             expected_ty = Tag.K_INT
@@ -370,14 +574,18 @@ class BinExpr(Expr):
         if not same(r_ty, expected_ty):
             err(self.rhs.loc, f"right-hand side of operator '{self.op}' must be of type '{expected_ty}' but is of type '{r_ty}'")
 
-        return result_ty
+        self.ty        = result_ty
+        self.__class__ = BIN_EXPRS[self.op] # quicken # pylint: disable=assigning-non-slot
+        return self.ty
 
     def eval(self, env):
-        l = self.lhs.eval(env)
-        r = self.rhs.eval(env)
+        """Only runs before check, which quickens self - e.g. when opt.Folder folds a new expression."""
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
         if self.op is Tag.T_ADD: return l +  r
         if self.op is Tag.T_SUB: return l -  r
         if self.op is Tag.T_MUL: return l *  r
+        if self.op is Tag.T_POW: return l ** r
         if self.op is Tag.K_AND: return l &  r
         if self.op is Tag.K_OR : return l |  r
         if self.op is Tag.T_EQ : return l == r
@@ -388,18 +596,38 @@ class BinExpr(Expr):
         if self.op is Tag.T_GE : return l >= r
         assert False
 
+    def closure(self):
+        l = yield self.lhs.closure()
+        r = yield self.rhs.closure()
+        if self.op is Tag.T_ADD: return lambda env: l(env) +  r(env)
+        if self.op is Tag.T_SUB: return lambda env: l(env) -  r(env)
+        if self.op is Tag.T_MUL: return lambda env: l(env) *  r(env)
+        if self.op is Tag.T_POW: return lambda env: l(env) ** r(env)
+        if self.op is Tag.K_AND: return lambda env: l(env) &  r(env)
+        if self.op is Tag.K_OR : return lambda env: l(env) |  r(env)
+        if self.op is Tag.T_EQ : return lambda env: l(env) == r(env)
+        if self.op is Tag.T_NE : return lambda env: l(env) != r(env)
+        if self.op is Tag.T_LT : return lambda env: l(env) <  r(env)
+        if self.op is Tag.T_LE : return lambda env: l(env) <= r(env)
+        if self.op is Tag.T_GT : return lambda env: l(env) >  r(env)
+        if self.op is Tag.T_GE : return lambda env: l(env) >= r(env)
+        assert False
+
 class UnaryExpr(Expr):
+    __slots__ = ("op", "rhs")
+
     def __init__(self, loc, op, rhs):
         super().__init__(loc)
         self.op  = op
         self.rhs = rhs
 
-    def __str__(self):
-        op = "!" if EMIT is Emit.C and self.op is Tag.K_NOT else str(self.op)
-        return f"{op}({self.rhs})"
+    def emit(self, out):
+        out.write("!(" if EMIT is Emit.C and self.op is Tag.K_NOT else f"{self.op}(")
+        yield self.rhs.emit(out)
+        out.write(")")
 
     def check(self, sema):
-        r_ty = self.rhs.check(sema)
+        r_ty = yield self.rhs.check(sema)
 
         if self.op is Tag.K_NOT:
             expected_ty = Tag.K_BOOL
@@ -411,23 +639,178 @@ class UnaryExpr(Expr):
         if not same(r_ty, expected_ty):
             err(self.rhs.loc, f"operand of operator '{self.op}' must be of type '{expected_ty}' but is of type '{r_ty}'")
 
-        return result_ty
+        self.ty        = result_ty
+        self.__class__ = UNARY_EXPRS[self.op] # quicken # pylint: disable=assigning-non-slot
+        return self.ty
 
     def eval(self, env):
-        r = self.rhs.eval(env)
+        """Only runs before check, which quickens self."""
+        r = yield self.rhs.eval(env)
         if self.op is Tag.K_NOT: return not r
         if self.op is Tag.T_ADD: return     r
         if self.op is Tag.T_SUB: return -   r
         assert False
 
+    def closure(self):
+        r = yield self.rhs.closure()
+        if self.op is Tag.K_NOT: return lambda env: not r(env)
+        if self.op is Tag.T_ADD: return r
+        if self.op is Tag.T_SUB: return lambda env: -   r(env)
+        assert False
+
+# quickening
+#
+# check swaps the class of each BinExpr and UnaryExpr for the subclass specialized to its operator,
+# so evaluating it involves no dispatch on the operator at all.
+# Each of them has the same layout as its base, and isinstance still holds, so all passes can ignore this.
+
+class AddExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l + r
+
+class SubExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l - r
+
+class MulExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l * r
+
+class PowExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l ** r
+
+class AndExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l & r
+
+class OrExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l | r
+
+class EqExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l == r
+
+class NeExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l != r
+
+class LtExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l < r
+
+class LeExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l <= r
+
+class GtExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l > r
+
+class GeExpr(BinExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        l = yield self.lhs.eval(env)
+        r = yield self.rhs.eval(env)
+        return l >= r
+
+class NotExpr(UnaryExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        return not (yield self.rhs.eval(env))
+
+class PlusExpr(UnaryExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        return (yield self.rhs.eval(env))
+
+class NegExpr(UnaryExpr):
+    __slots__ = ()
+
+    def eval(self, env):
+        return -(yield self.rhs.eval(env))
+
+BIN_EXPRS = {
+    Tag.T_ADD: AddExpr,
+    Tag.T_SUB: SubExpr,
+    Tag.T_MUL: MulExpr,
+    Tag.T_POW: PowExpr,
+    Tag.K_AND: AndExpr,
+    Tag.K_OR : OrExpr,
+    Tag.T_EQ : EqExpr,
+    Tag.T_NE : NeExpr,
+    Tag.T_LT : LtExpr,
+    Tag.T_LE : LeExpr,
+    Tag.T_GT : GtExpr,
+    Tag.T_GE : GeExpr,
+}
+
+UNARY_EXPRS = {
+    Tag.K_NOT: NotExpr,
+    Tag.T_ADD: PlusExpr,
+    Tag.T_SUB: NegExpr,
+}
+
 class BoolExpr(Expr):
+    __slots__ = ("val",)
+
     def __init__(self, loc, val):
         super().__init__(loc)
         self.val = val
 
-    def __str__(self):
-        if EMIT is Emit.PY: return "True" if self.val else "False"
-        return "true" if self.val else "false"
+    def emit(self, out):
+        if EMIT is Emit.PY:
+            out.write("True" if self.val else "False")
+        else:
+            out.write("true" if self.val else "false")
 
     def check(self, _):
         self.ty = Tag.K_BOOL
@@ -436,14 +819,20 @@ class BoolExpr(Expr):
     def eval(self, _):
         return self.val
 
+    def closure(self):
+        val = self.val
+        return lambda _: val
+
 class SymExpr(Expr):
+    __slots__ = ("sym", "decl")
+
     def __init__(self, loc, sym):
         super().__init__(loc)
         self.sym  = sym
         self.decl = None
 
-    def __str__(self):
-        return f"{name(self.decl, self.sym)}"
+    def emit(self, out):
+        out.write(f"{name(self.decl, self.sym)}")
 
     def check(self, sema):
         if (decl := sema.find(self.sym)) is not None:
@@ -453,15 +842,21 @@ class SymExpr(Expr):
         return None
 
     def eval(self, env):
-        return env[name(self.decl)]
+        return env[self.decl.slot]
+
+    def closure(self):
+        slot = self.decl.slot
+        return lambda env: env[slot]
 
 class LitExpr(Expr):
+    __slots__ = ("val",)
+
     def __init__(self, loc, val):
         super().__init__(loc)
         self.val = val
 
-    def __str__(self):
-        return f"{self.val}"
+    def emit(self, out):
+        out.write(f"{self.val}")
 
     def check(self, _):
         self.ty = Tag.K_INT
@@ -470,9 +865,15 @@ class LitExpr(Expr):
     def eval(self, _):
         return self.val
 
+    def closure(self):
+        val = self.val
+        return lambda _: val
+
 class ErrExpr(Expr):
-    def __str__(self):
-        return "<error>"
+    __slots__ = ()
+
+    def emit(self, out):
+        out.write("<error>")
 
     def check(self, _):
         return None